@@ -5,6 +5,7 @@ rigify_info = {
 from .operators import regenerate_rigify_rigs
 from .operators import refresh_drivers
 from .operators import mirror_rigify
+from .operators import rescale_rig
 from . import cloud_generator
 from . import ui
 
@@ -26,6 +27,7 @@ def register():
 	regenerate_rigify_rigs.register()
 	refresh_drivers.register()
 	mirror_rigify.register()
+	rescale_rig.register()
 
 	cloud_generator.register()
 	ui.register()
@@ -40,6 +42,7 @@ def unregister():
 	regenerate_rigify_rigs.unregister()
 	refresh_drivers.unregister()
 	mirror_rigify.unregister()
+	rescale_rig.unregister()
 
 	cloud_generator.unregister()
 	ui.unregister()
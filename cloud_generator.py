@@ -1,9 +1,12 @@
-import bpy, os
+import bpy, os, time, ast
 from mathutils import Matrix
 from bpy.props import BoolProperty, StringProperty, EnumProperty, PointerProperty, BoolVectorProperty
 from rigify.generate import *
 from .definitions.bone_group import BoneGroupContainer
 from .rigs import cloud_utils
+from .cloud_symmetry import SymmetryPlanner
+from .cloud_validation import MetarigValidator
+from .cloud_refit import planned_bones, write_edit_bones
 
 separators = [
 	(".", ".", "."),
@@ -41,6 +44,11 @@ class CloudRigProperties(bpy.types.PropertyGroup):
 		,description = "Whether helper bones can be selected or not"
 		,default	 = True
 	)
+	symmetric_generation: BoolProperty(
+		name		 = "Symmetric Generation"
+		,description = "Generate right side rig elements by mirroring their left side counterparts, where the metarig is symmetrical. This is faster, and falls back to normal generation where the sides don't match"
+		,default	 = False
+	)
 	properties_bone: BoolProperty(
 		name		 = "Properties Bone"
 		,description = "Specify a bone to store Properties on. This bone doesn't have to exist in the metarig"
@@ -149,6 +157,31 @@ class CloudGenerator(Generator):
 		self.suffix_separator = self.params.cloudrig_parameters.suffix_separator
 		assert self.prefix_separator != self.suffix_separator, "CloudGenerator Error: Prefix and Suffix separators cannot be the same."
 
+		# Metarig drivers indexed by bone name, built on first use. See get_metarig_drivers().
+		self.metarig_drivers = None
+
+		# True while refit() plans the bones. Rigs must not modify other datablocks then, since refit() only moves bones.
+		self.refitting = False
+
+		# Mirrors the planning of right side rigs from left side ones, if enabled. See cloud_symmetry.py.
+		self.symmetry = None
+
+	def get_metarig_drivers(self, bone_name):
+		""" Return a list of (fcurve, is_data) tuples for the metarig drivers that belong to a bone.
+		is_data is True for drivers on the metarig's Armature datablock, False for ones on the Object.
+		The drivers are indexed once per generation, so lookups don't scan every driver of the metarig.
+		"""
+		if self.metarig_drivers is None:
+			self.metarig_drivers = {}
+			for id_data, is_data in ((self.metarig, False), (self.metarig.data, True)):
+				if not id_data.animation_data: continue
+				for fc in id_data.animation_data.drivers:
+					name = cloud_utils.bone_name_from_data_path(fc.data_path)
+					if name is None: continue
+					self.metarig_drivers.setdefault(name, []).append((fc, is_data))
+
+		return self.metarig_drivers.get(bone_name, [])
+
 	def create_rig_object(self):
 		scene = self.scene
 
@@ -305,6 +338,11 @@ class CloudGenerator(Generator):
 		metarig = self.metarig
 		t = Timer()
 
+		# Find metarig errors before the rig is touched.
+		MetarigValidator(metarig).validate()
+
+		t.tick("Validate metarig: ")
+
 		self.collection = context.scene.collection
 		if len(self.metarig.users_collection) > 0:
 			self.collection = self.metarig.users_collection[0]
@@ -392,6 +430,12 @@ class CloudGenerator(Generator):
 
 		t.tick("Initialize rigs: ")
 
+		if self.params.cloudrig_parameters.symmetric_generation:
+			self.symmetry = SymmetryPlanner(self)
+			self.symmetry.find_pairs()
+
+			t.tick("Find symmetrical rigs: ")
+
 		# Copy Rigify Layers from metarig to target rig
 		for i in range(len(obj.data.rigify_layers), len(self.metarig.data.rigify_layers)):
 			obj.data.rigify_layers.add()
@@ -410,6 +454,11 @@ class CloudGenerator(Generator):
 
 		t.tick("Prepare bones: ")
 
+		if self.symmetry:
+			self.symmetry.mirror_rigs()
+
+			t.tick("Mirror rigs: ")
+
 		#------------------------------------------
 		bpy.ops.object.mode_set(mode='OBJECT')
 		bpy.ops.object.mode_set(mode='EDIT')
@@ -495,6 +544,11 @@ class CloudGenerator(Generator):
 
 		# Load and execute cloudrig.py rig UI script
 		obj.data['script'] = self.load_ui_script()
+		# Lets cloudrig.py know when its cached UI data of this rig is out of date.
+		obj.data['cloudrig_generation'] = time.time()
+		obj.data['cloudrig_roles'] = self.build_role_index()
+		obj.data['cloudrig_layers'] = self.build_layer_layout()
+		self.store_prop_hierarchies()
 
 		# Armature display settings
 		obj.display_type = self.metarig.display_type
@@ -537,6 +591,170 @@ class CloudGenerator(Generator):
 		# Refresh drivers
 		bpy.ops.object.refresh_drivers(selected_only=False)
 
+	def build_role_index(self):
+		""" Return lists of bone names by their role in the rig, so cloudrig.py and pipeline scripts don't have to search through every bone.
+		Controls are listed by the name of their bone set. Deform bones are found by use_deform, mechanism bones by the bone sets they belong to.
+		"""
+		obj = self.obj
+		controls = {}
+		mechanism = []
+		for rig in self.rig_list:
+			if not hasattr(rig, 'bone_infos'): continue
+			overrides = {ui_name : set_info['override'] for ui_name, set_info in type(rig).bone_sets.items()}
+			for bi in rig.bone_infos.bones:
+				if bi.name not in obj.pose.bones: continue
+				ui_name = bi.bone_set
+				override = overrides.get(ui_name)
+				if override == 'MCH':
+					mechanism.append(bi.name)
+				elif override == '':
+					controls.setdefault(ui_name, []).append(bi.name)
+
+		properties = [pb.name for pb in obj.pose.bones if pb.name.startswith("Properties")]
+		character = [name for name in properties if name.startswith("Properties_Character")]
+		return {
+			'properties'	: properties
+			,'character'	: character[0] if character else ""
+			,'outfits'		: [name for name in properties if name.startswith("Properties_Outfit_")]
+			,'controls'		: {ui_name : list(dict.fromkeys(names)) for ui_name, names in controls.items()}
+			,'deform'		: [b.name for b in obj.data.bones if b.use_deform]
+			,'mechanism'	: list(dict.fromkeys(mechanism))
+		}
+
+	def build_layer_layout(self):
+		""" Rows of layer toggles for the Layers panel of cloudrig.py, each a dictionary of layer indices and names, in the order they should be drawn. """
+		rows = {}
+		for i, rigify_layer in enumerate(self.obj.data.rigify_layers):
+			name = rigify_layer.name
+			if name in ["", " "] or name.startswith("$"): continue
+			row = rows.setdefault(rigify_layer.row, {'indices' : [], 'names' : []})
+			row['indices'].append(i)
+			row['names'].append(name)
+
+		return [rows[row_index] for row_index in sorted(rows.keys())]
+
+	def store_prop_hierarchies(self):
+		""" Properties bones can have a 'prop_hierarchy' string describing which properties are only drawn when another property is enabled.
+		Store it as a dictionary on the generated rig, so cloudrig.py doesn't have to parse it.
+		"""
+		for name in self.obj.data['cloudrig_roles']['properties']:
+			pose_bone = self.obj.pose.bones[name]
+			hierarchy = pose_bone.get('prop_hierarchy')
+			if type(hierarchy) != str: continue
+			try:
+				pose_bone['prop_hierarchy'] = ast.literal_eval(hierarchy)
+			except (ValueError, SyntaxError):
+				print(f"WARNING: Could not parse prop_hierarchy of {name}, expected a dictionary of property names to lists of property names: {hierarchy}")
+
+	def refit(self):
+		""" Move the bones of the existing generated rig to match the metarig, without regenerating it.
+		Only the bone positions are planned, on a temporary rig, so the real rig's constraints, drivers, custom properties and bone groups are left untouched.
+		Curve objects are left untouched as well, so hooks of curve rigs stay where the curve points are.
+		Only use this when the metarig's bones and parameters haven't changed since the last generation.
+		Return the names of planned bones that don't exist in the rig, meaning it needs to be regenerated.
+		"""
+		print("CloudRig Re-fit begin")
+
+		context = self.context
+		rig = self.params.rigify_target_rig
+		assert rig and 'cloudrig' in rig.data, "Error: Re-fitting requires an existing generated rig."
+		t = Timer()
+
+		MetarigValidator(self.metarig).validate()
+
+		self.collection = context.scene.collection
+		if len(self.metarig.users_collection) > 0:
+			self.collection = self.metarig.users_collection[0]
+
+		bpy.ops.object.mode_set(mode='OBJECT')
+		self.wgt_collection = self.ensure_widget_collection()
+
+		# Plan the bones on a temporary rig, the same way generate() would.
+		temp_data = bpy.data.armatures.new("REFIT-" + rig.name)
+		self.obj = bpy.data.objects.new(temp_data.name, temp_data)
+		self.collection.objects.link(self.obj)
+		select_object(context, self.obj, deselect_all=True)
+		self.refitting = True
+		try:
+			self._Generator__duplicate_rig()
+			bpy.ops.object.mode_set(mode='OBJECT')
+			self._Generator__rename_org_bones()
+
+			self.instantiate_rig_tree()
+			self.invoke_initialize()
+			if self.params.cloudrig_parameters.symmetric_generation:
+				self.symmetry = SymmetryPlanner(self)
+				self.symmetry.find_pairs()
+
+			bpy.ops.object.mode_set(mode='EDIT')
+			self.invoke_prepare_bones()
+			if self.symmetry:
+				self.symmetry.mirror_rigs()
+			bpy.ops.object.mode_set(mode='OBJECT')
+		finally:
+			self.refitting = False
+			bpy.data.objects.remove(self.obj)
+			bpy.data.armatures.remove(temp_data)
+			self.obj = rig
+
+		t.tick("Plan bones: ")
+
+		backup_matrix = rig.matrix_world.copy()
+		rig.matrix_world = Matrix()
+		select_object(context, rig, deselect_all=True)
+
+		bpy.ops.object.mode_set(mode='EDIT')
+		missing = write_edit_bones(self.rig_list, rig.data.edit_bones)
+
+		t.tick("Write edit bones: ")
+
+		bpy.ops.object.mode_set(mode='OBJECT')
+		for rig_element, bi in planned_bones(self.rig_list):
+			pose_bone = rig.pose.bones.get(bi.name)
+			if not pose_bone: continue
+			self.refit_pose_bone(rig_element, bi, pose_bone)
+
+		rig.matrix_world = backup_matrix
+
+		t.tick("Write constants: ")
+
+		if missing:
+			print(f"WARNING: Re-fit found {len(missing)} bones that are missing from the rig, it should be regenerated: {sorted(missing)}")
+		return missing
+
+	def refit_pose_bone(self, rig_element, bone_info, pose_bone):
+		""" Update the values of a pose bone that are derived from bone positions: shape scale, constraint numbers and driver expressions. """
+		bi = bone_info
+		shape_scale = bi.custom_shape_scale
+		if not bi.use_custom_shape_bone_size:
+			# Same as CloudBaseRig.configure_bones().
+			shape_scale *= rig_element.scale * bi.bbone_width * 10
+		pose_bone.custom_shape_scale = shape_scale
+
+		for i, (con_type, con_info) in enumerate(bi.constraints):
+			if 'name' in con_info:
+				c = pose_bone.constraints.get(con_info['name'])
+			else:
+				c = pose_bone.constraints[i] if i < len(pose_bone.constraints) else None
+			if not c or c.type != con_type: continue
+			for key, value in con_info.items():
+				if type(value) == float and hasattr(c, key):
+					setattr(c, key, value)
+			if c.type == 'STRETCH_TO':
+				# Let Blender calculate the new rest length.
+				c.rest_length = 0
+
+		rig = pose_bone.id_data
+		for id_data, drivers, path_prefix in (
+			(rig, bi.drivers, f'pose.bones["{pose_bone.name}"].')
+			,(rig.data, bi.bone_drivers, f'bones["{pose_bone.name}"].')
+		):
+			if not drivers or not id_data.animation_data: continue
+			for path, d in drivers.items():
+				fc = id_data.animation_data.drivers.find(path_prefix + path)
+				if fc and fc.driver.expression != d.expression:
+					fc.driver.expression = d.expression
+
 def generate_rig(context, metarig):
 	""" Generates a rig from a metarig.	"""
 	# Initial configuration
@@ -558,6 +776,17 @@ def generate_rig(context, metarig):
 		# Continue the exception
 		raise e
 
+def refit_rig(context, metarig):
+	""" Re-fits the generated rig of a metarig to its current bone positions. """
+	rest_backup = metarig.data.pose_position
+	metarig.data.pose_position = 'REST'
+
+	try:
+		return CloudGenerator(context, metarig).refit()
+	finally:
+		bpy.ops.object.mode_set(mode='OBJECT')
+		metarig.data.pose_position = rest_backup
+
 def register():
 	from bpy.utils import register_class
 	register_class(CloudRigProperties)
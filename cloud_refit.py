@@ -0,0 +1,22 @@
+# Re-fitting writes the bone positions planned for the metarig into an existing generated rig, see CloudGenerator.refit().
+# This module doesn't depend on bpy, so it can be tested on its own.
+
+def planned_bones(rig_list):
+	""" Yield (rig, BoneInfo) tuples of every bone planned by the rigs in rig_list.
+	Rigs that don't plan their bones with BoneInfos, like cloud_bone, are skipped.
+	"""
+	for rig in rig_list:
+		if not hasattr(rig, 'bone_infos'): continue
+		for bi in rig.bone_infos.bones:
+			yield rig, bi
+
+def write_edit_bones(rig_list, edit_bones):
+	""" Write the planned geometry into the existing edit bones. Return the names of planned bones that don't exist. """
+	missing = set()
+	for rig, bi in planned_bones(rig_list):
+		edit_bone = edit_bones.get(bi.name)
+		if not edit_bone:
+			missing.add(bi.name)
+			continue
+		bi.write_edit_geometry(edit_bone)
+	return missing
@@ -0,0 +1,355 @@
+# Symmetric generation: Instead of planning both sides of a symmetrical character, plan the left side,
+# then derive the right side's BoneInfos, constraints, drivers and UI data from it by mirroring geometry and flipping names.
+# Right side rigs that can't be mirrored safely go through normal generation instead.
+
+import bpy, re, copy
+from mathutils import Vector
+
+from rigify.base_rig import BaseRig
+
+from .definitions.bone import BoneInfo
+from .definitions.bone_group import BoneGroup
+from .definitions.driver import Driver
+from .definitions.custom_props import CustomProp
+from .rigs.cloud_utils import flip_name
+
+# Matches the quoted parts of data paths, eg. the bone and property name in 'pose.bones["Properties"]["ik_left_arm"]'.
+data_path_token = re.compile(r'\["((?:[^"\\]|\\.)*)"\]')
+
+def mirror_vector(vec):
+	return Vector((-vec.x, vec.y, vec.z))
+
+class SymmetryPlanner:
+	""" Pairs up left and right side rigs after the initialize stage, and mirrors the left side's planned bones onto the right side after the prepare_bones stage. """
+
+	def __init__(self, generator):
+		self.generator = generator
+		self.tolerance = max(max(generator.metarig.dimensions) * 1e-5, 1e-6)
+		# List of lists of (left rig, right rig) pairs. Each list is a rig and its descendants, which can only be mirrored together.
+		self.subtrees = []
+
+		# Filled per subtree while mirroring.
+		self.rig_map = {}
+		self.bone_map = {}
+		self.name_map = {}
+		self.substitutions = {}
+		self.substitution_re = None
+		self.memo = {}
+
+	def find_pairs(self):
+		""" Find the subtrees of left side rigs that can be mirrored onto the right side, and mark the right side rigs to skip their prepare_bones stage. """
+		rigs_by_base_bone = {rig.base_bone : rig for rig in self.generator.rig_list}
+
+		for rig in self.generator.rig_list:
+			if getattr(rig, 'side_suffix', "") != 'L': continue
+			parent = rig.rigify_parent
+			if parent and getattr(parent, 'side_suffix', "") == 'L':
+				# Not the top of a left side subtree.
+				continue
+
+			pairs = []
+			reason = self.check_subtree(rig, rigs_by_base_bone, pairs)
+			if reason:
+				print(f"Symmetric generation: {rig.base_bone} will be generated normally: {reason}")
+				continue
+
+			for left, right in pairs:
+				right.mirror_source = left
+			self.subtrees.append(pairs)
+
+	def check_subtree(self, left, rigs_by_base_bone, pairs):
+		""" Pair up a left side rig and all its descendants with their right side counterparts. Return the reason if they can't be mirrored. """
+		right = rigs_by_base_bone.get(flip_name(left.base_bone))
+		if not right or right is left:
+			return "No right side counterpart."
+
+		reason = self.check_pair(left, right)
+		if reason:
+			return reason
+		pairs.append((left, right))
+
+		right_children = {child.base_bone for child in right.rigify_children}
+		for child in left.rigify_children:
+			if flip_name(child.base_bone) not in right_children:
+				return f"{child.base_bone} has no right side counterpart."
+			reason = self.check_subtree(child, rigs_by_base_bone, pairs)
+			if reason:
+				return reason
+		if len(right_children) != len(left.rigify_children):
+			return "The right side has more child rigs."
+
+	def check_pair(self, left, right):
+		""" Return the reason why a pair of rigs can't be mirrored, or None if they can. """
+		if type(left) != type(right):
+			return "Rig types don't match."
+		if not getattr(left, 'symmetry_mirrorable', False):
+			return f"{type(left).__name__} does not support mirroring."
+
+		parent = left.rigify_parent
+		if parent and getattr(parent, 'side_suffix', "") != 'L':
+			# Chain rigs modify their parent chain's bones, which wouldn't get mirrored if the parent isn't mirrored.
+			if hasattr(parent, 'def_bones') and not getattr(parent.params, 'CR_cap_control', True):
+				return "Parent is a chain rig without a cap control."
+
+		metarig = self.generator.metarig
+		left_chain = left.bones.org.main
+		right_chain = right.bones.org.main
+		if len(left_chain) != len(right_chain):
+			return "Bone chains have different lengths."
+		for left_name, right_name in zip(left_chain, right_chain):
+			if flip_name(left_name) != right_name:
+				return f"{right_name} is not the mirror of {left_name}."
+			reason = self.check_bones(metarig.data.bones.get(left_name[4:]), metarig.data.bones.get(right_name[4:]))
+			if reason:
+				return reason
+
+		return self.check_params(left, right)
+
+	def check_bones(self, left_bone, right_bone):
+		""" Return the reason why two metarig bones aren't mirrored, or None if they are. """
+		if not left_bone or not right_bone:
+			return "Metarig bone not found."
+		tol = self.tolerance
+		if (mirror_vector(left_bone.head_local) - right_bone.head_local).length > tol \
+			or (mirror_vector(left_bone.tail_local) - right_bone.tail_local).length > tol:
+			return f"{right_bone.name} is not in the mirrored position of {left_bone.name}."
+		if (mirror_vector(left_bone.z_axis) - right_bone.z_axis).length > 1e-4:
+			return f"{right_bone.name} doesn't have the mirrored roll of {left_bone.name}."
+		for attr in ('bbone_x', 'bbone_z', 'envelope_distance', 'head_radius', 'tail_radius'):
+			if abs(getattr(left_bone, attr) - getattr(right_bone, attr)) > tol:
+				return f"{right_bone.name} has a different {attr} than {left_bone.name}."
+		for attr in ('bbone_segments', 'use_connect', 'envelope_weight', 'use_envelope_multiply'):
+			if getattr(left_bone, attr) != getattr(right_bone, attr):
+				return f"{right_bone.name} has a different {attr} than {left_bone.name}."
+
+	def check_params(self, left, right):
+		""" Return the reason why two rigs' parameters don't match, or None if they do.
+		String parameters match if they are equal or mirrored, and if they name a metarig bone, that bone must be mirrored too. """
+		left_params = left.params
+		right_params = right.params
+		metarig_bones = self.generator.metarig.data.bones
+		for key in set(left_params.keys()) | set(right_params.keys()):
+			left_value = getattr(left_params, key, None)
+			right_value = getattr(right_params, key, None)
+			if isinstance(left_value, str) and isinstance(right_value, str):
+				if left_value != right_value and flip_name(left_value) != right_value:
+					return f"Parameter {key} doesn't match."
+				if left_value != right_value and left_value in metarig_bones:
+					reason = self.check_bones(metarig_bones.get(left_value), metarig_bones.get(right_value))
+					if reason:
+						return reason
+				continue
+			if hasattr(left_value, '__len__') and hasattr(right_value, '__len__'):
+				left_value = tuple(left_value)
+				right_value = tuple(right_value)
+			if left_value != right_value:
+				return f"Parameter {key} doesn't match."
+
+	##############################
+	# Mirroring
+
+	def mirror_rigs(self):
+		""" Mirror the planned bones of each paired left side subtree onto the right side. Fall back to normal planning when that fails. """
+		mirrored = 0
+		for pairs in self.subtrees:
+			reason = self.plan_subtree(pairs)
+			if reason:
+				print(f"Symmetric generation: {pairs[0][1].base_bone} will be generated normally: {reason}")
+				for left, right in pairs:
+					right.mirror_source = None
+				for left, right in pairs:
+					right.rigify_invoke_stage('prepare_bones')
+				continue
+
+			self.apply_subtree(pairs)
+			mirrored += len(pairs)
+		print(f"Symmetric generation: Mirrored {mirrored} rigs.")
+
+	def plan_subtree(self, pairs):
+		""" Work out the name of each mirrored bone and the identifier substitutions between the two sides. Return the reason if the subtree can't be mirrored. """
+		self.rig_map = {left : right for left, right in pairs}
+		self.bone_map = {}
+		self.name_map = {}
+		self.memo = {}
+
+		# Identifiers that differ between the two sides, eg. "Left"->"Right", "ik_left_arm"->"ik_right_arm".
+		self.substitutions = {}
+		for left, right in pairs:
+			for attr, left_value in left.__dict__.items():
+				right_value = right.__dict__.get(attr)
+				if not isinstance(left_value, str) or not isinstance(right_value, str): continue
+				if left_value == right_value or not left_value or not right_value: continue
+				if self.substitutions.get(left_value, right_value) != right_value:
+					return f"{attr} can't be mirrored unambiguously."
+				self.substitutions[left_value] = right_value
+
+		self.substitution_re = None
+		if self.substitutions:
+			keys = sorted(self.substitutions.keys(), key=len, reverse=True)
+			self.substitution_re = re.compile(r'(?<![A-Za-z0-9])(' + "|".join(re.escape(k) for k in keys) + r')(?![A-Za-z0-9])')
+
+		left_names = set()
+		for left, right in pairs:
+			left_names.update(bi.name for bi in left.bone_infos.bones)
+
+		mirrored_names = set()
+		for left, right in pairs:
+			for bi in left.bone_infos.bones:
+				name = flip_name(bi.name)
+				if name == bi.name:
+					name = self.substitute(bi.name)
+				if name == bi.name:
+					# Bones that can't be flipped are shared between the two sides, like the root or properties bone.
+					# These must lie on the symmetry plane, otherwise the two sides would fight over them.
+					if abs(bi.head.x) > self.tolerance or abs(bi.tail.x) > self.tolerance:
+						return f"Bone name can't be mirrored: {bi.name}"
+				elif name in left_names or name in mirrored_names:
+					return f"Mirrored bone name is already taken: {name}"
+				mirrored_names.add(name)
+				self.name_map[bi.name] = name
+
+		for left, right in pairs:
+			if self.map_string(left.bones.parent) != right.bones.parent:
+				return f"Parent bone {right.bones.parent} is not the mirror of {left.bones.parent}."
+
+	def apply_subtree(self, pairs):
+		""" Mirror the bones, rig attributes and UI data of the left side rigs onto the right side rigs. """
+		# Create the mirrored BoneInfos first, so references between bones can be mapped.
+		for left, right in pairs:
+			for bone_info in left.bone_infos.bones:
+				mirrored = BoneInfo.__new__(BoneInfo)
+				self.bone_map[bone_info] = mirrored
+
+		for left, right in pairs:
+			container = right.bone_infos
+			for bone_info in container.bones:
+				if bone_info._bone_group:
+					bone_info._bone_group.remove_bone(bone_info)
+			container.bones = []
+
+			for bone_info in left.bone_infos.bones:
+				mirrored = self.bone_map[bone_info]
+				self.mirror_bone_info(bone_info, mirrored, container)
+				container.bones.append(mirrored)
+
+		for left, right in pairs:
+			self.mirror_rig_attributes(left, right)
+
+		for left, right in pairs:
+			right.mirror_from_rig(left)
+			for ui_area, row_name, col_name, info, default, _min, _max in left.ui_data_log:
+				right.add_ui_data(
+					ui_area
+					,self.map_string(row_name)
+					,self.map_string(col_name)
+					,self.map_value(info)
+					,default = default
+					,_min = _min
+					,_max = _max
+				)
+
+	def mirror_bone_info(self, bone_info, mirrored, container):
+		for key, value in bone_info.__dict__.items():
+			if key in ('container', '_bone_group', 'bone_set'): continue
+			setattr(mirrored, key, self.map_value(value))
+		mirrored.container = container
+		mirrored.name = self.name_map[bone_info.name]
+		# Bone set names are the same on both sides.
+		mirrored.bone_set = bone_info.bone_set
+
+		# Mirroring flips the bone's local X axis, so roll and curve offsets along X flip as well.
+		mirrored.roll = -bone_info.roll
+		mirrored.bbone_curveinx = -bone_info.bbone_curveinx
+		mirrored.bbone_curveoutx = -bone_info.bbone_curveoutx
+
+		mirrored._bone_group = None
+		mirrored.bone_group = self.map_value(bone_info._bone_group)
+
+	def mirror_rig_attributes(self, left, right):
+		""" Copy the attributes that the left rig created during prepare_bones onto the right rig.
+		Attributes the right rig created itself during initialize are kept, unless they hold bones. """
+		for attr, value in left.__dict__.items():
+			if attr in ('bone_infos', 'mirror_source', 'ui_data_log'): continue
+			if attr in right.__dict__ and not self.contains_bones(value): continue
+			setattr(right, attr, self.map_value(value))
+
+	def contains_bones(self, value):
+		if isinstance(value, BoneInfo):
+			return True
+		if isinstance(value, (list, tuple, set)):
+			return any(self.contains_bones(v) for v in value)
+		if isinstance(value, dict):
+			return any(self.contains_bones(v) for v in value.values())
+		return False
+
+	def substitute(self, string):
+		""" Replace the side identifiers in a string that isn't a bone name. """
+		if string in self.substitutions:
+			return self.substitutions[string]
+		if not self.substitution_re:
+			return string
+		return self.substitution_re.sub(lambda match: self.substitutions[match.group(1)], string)
+
+	def map_string(self, string):
+		if string in self.name_map:
+			return self.name_map[string]
+		if '["' in string:
+			return data_path_token.sub(lambda match: '["' + self.map_string(match.group(1)) + '"]', string)
+		return self.substitute(string)
+
+	def map_driver(self, driver):
+		mirrored = driver.clone()
+		for var in mirrored.variables:
+			for target in var.targets:
+				target.bone_target = self.map_string(target.bone_target)
+				target.data_path = self.map_string(target.data_path)
+		return mirrored
+
+	def map_value(self, value):
+		""" Return the right side version of a value planned by the left side. """
+		if isinstance(value, str):
+			return self.map_string(value)
+		if isinstance(value, BoneInfo):
+			return self.bone_map.get(value, value)
+		if isinstance(value, Vector) and len(value) == 3:
+			return mirror_vector(value)
+		if isinstance(value, (bool, int, float)) or value is None:
+			return value
+
+		# Containers are only mapped once, so that lists shared between attributes stay shared.
+		key = id(value)
+		if key in self.memo:
+			return self.memo[key][1]
+
+		mirrored = value
+		if isinstance(value, list):
+			mirrored = []
+			self.memo[key] = (value, mirrored)
+			mirrored.extend(self.map_value(v) for v in value)
+		elif isinstance(value, tuple):
+			mirrored = tuple(self.map_value(v) for v in value)
+		elif isinstance(value, set):
+			mirrored = {self.map_value(v) for v in value}
+		elif isinstance(value, dict):
+			mirrored = type(value)()
+			self.memo[key] = (value, mirrored)
+			for k, v in value.items():
+				mirrored[self.map_value(k)] = self.map_value(v)
+		elif isinstance(value, Driver):
+			mirrored = self.map_driver(value)
+		elif isinstance(value, CustomProp):
+			mirrored = copy.copy(value)
+			mirrored.name = self.map_string(value.name)
+		elif isinstance(value, BoneGroup):
+			mirrored = self.generator.bone_groups.get(self.map_string(value.name), value)
+		elif isinstance(value, bpy.types.PoseBone):
+			mirrored = value.id_data.pose.bones.get(self.map_string(value.name), value)
+		elif isinstance(value, bpy.types.EditBone):
+			mirrored = value.id_data.edit_bones.get(self.map_string(value.name), value)
+		elif isinstance(value, bpy.types.Bone):
+			mirrored = value.id_data.bones.get(self.map_string(value.name), value)
+		elif isinstance(value, BaseRig):
+			mirrored = self.rig_map.get(value, value)
+
+		self.memo[key] = (value, mirrored)
+		return mirrored
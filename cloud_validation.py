@@ -0,0 +1,44 @@
+from rigify.utils.errors import MetarigError
+from rigify.utils.rig import get_rig_type, connected_children_names
+
+class MetarigValidator:
+	""" Checks a metarig for errors before generation touches anything, so every error can be reported at once.
+	Rig types add their checks by implementing the validate_metarig() classmethod, see CloudBaseRig.
+	"""
+
+	def __init__(self, metarig):
+		self.metarig = metarig
+		self.errors = []
+		# Bone name : Names of the bone and its connected children, the same as the ORG chain of a rig on that bone.
+		self.chains = {}
+
+	def chain(self, pose_bone):
+		chain = self.chains.get(pose_bone.name)
+		if chain is None:
+			chain = self.chains[pose_bone.name] = [pose_bone.name] + connected_children_names(self.metarig, pose_bone.name)
+		return chain
+
+	def check(self, condition, message):
+		""" Store the message if the condition is False. Return the condition, so dependent checks can be skipped. """
+		if not condition:
+			self.errors.append(message)
+		return condition
+
+	def validate(self):
+		""" Run the checks of each rig in the metarig, and raise a MetarigError listing every error that was found. """
+		for pose_bone in self.metarig.pose.bones:
+			rig_type = pose_bone.rigify_type
+			if rig_type == "": continue
+			try:
+				rig_class = get_rig_type(rig_type).Rig
+			except (KeyError, ImportError, AttributeError):
+				self.errors.append(f"Rig type {rig_type} on bone {pose_bone.name} was not found.")
+				continue
+
+			if hasattr(rig_class, 'validate_metarig'):
+				rig_class.validate_metarig(self, pose_bone)
+
+		if self.errors:
+			message = f"Found {len(self.errors)} errors in metarig {self.metarig.name}:\n" + "\n".join(self.errors)
+			print(message)
+			raise MetarigError(message)
@@ -6,38 +6,215 @@
 # to co-exist in the same scene.
 # So each rig uses the script that belongs to it, and not another, potentially newer or older version.
 
-import bpy, traceback, json
-from bpy.props import StringProperty, BoolProperty, BoolVectorProperty, EnumProperty, FloatVectorProperty, PointerProperty, CollectionProperty
+import bpy, traceback, json, ast
+from bpy.props import StringProperty, BoolProperty, BoolVectorProperty, EnumProperty, IntProperty, FloatVectorProperty, PointerProperty, CollectionProperty
 from mathutils import Vector, Matrix
-from math import radians, acos
+from math import cos, sin
 from rna_prop_ui import rna_idprop_quote_path
 
 script_id = "SCRIPT_ID"
 
+# CloudRig armatures in the file, see get_rigs(). Cleared by the handlers below when armatures may have been added, removed or generated.
+rig_index = None
+# Number of objects in the file when rig_index was built.
+rig_index_object_count = 0
+# Armature object pointer : (Armature data pointer, whether it's a CloudRig) when rig_index was built.
+rig_index_armatures = {}
+# Armature data pointer : Whether it's a CloudRig, when rig_index was built.
+rig_index_data = {}
+
 def get_rigs():
 	""" Find all cloudrig armatures in the file. """
-	return [o for o in bpy.data.objects if o.type=='ARMATURE' and 'cloudrig' in o.data]
+	global rig_index, rig_index_object_count, rig_index_armatures, rig_index_data
+	if rig_index is None:
+		armatures = [o for o in bpy.data.objects if o.type=='ARMATURE']
+		rig_index = [o for o in armatures if 'cloudrig' in o.data]
+		rig_index_object_count = len(bpy.data.objects)
+		rig_index_armatures = {o.as_pointer() : (o.data.as_pointer(), 'cloudrig' in o.data) for o in armatures}
+		rig_index_data = {data_pointer : is_rig for data_pointer, is_rig in rig_index_armatures.values()}
+	return rig_index
+
+def clear_rig_index():
+	global rig_index
+	rig_index = None
+	# Entries of removed rigs would otherwise stay forever, and their addresses could be re-used by other rigs.
+	rig_caches.clear()
+
+def changes_rig_index(id):
+	""" Whether an updated ID is an armature that was added, replaced, or became a CloudRig since rig_index was built. """
+	if isinstance(id, bpy.types.Object):
+		known = rig_index_armatures.get(id.as_pointer())
+		if id.type != 'ARMATURE':
+			# An object at the address of a known armature means that armature was removed.
+			return known is not None
+		return known != (id.data.as_pointer(), 'cloudrig' in id.data)
+	if isinstance(id, bpy.types.Armature):
+		is_rig = rig_index_data.get(id.as_pointer())
+		return is_rig is not None and is_rig != ('cloudrig' in id)
+	return False
+
+@bpy.app.handlers.persistent
+def cloudrig_depsgraph_handler(scene, depsgraph):
+	if rig_index is None:
+		return
+	# Most updates, like frame changes, don't touch objects or armatures at all.
+	if not (depsgraph.id_type_updated('OBJECT') or depsgraph.id_type_updated('ARMATURE')):
+		return
+	# Removed objects don't show up in the updates, but they change the object count.
+	# Objects added in the same update do show up, so only the updated IDs need to be checked.
+	if len(bpy.data.objects) != rig_index_object_count \
+		or any(changes_rig_index(update.id.original) for update in depsgraph.updates):
+		clear_rig_index()
+		# An object that was added may have the address of one that was removed.
+		clear_panel_facts()
+
+@bpy.app.handlers.persistent
+def cloudrig_load_handler(dummy1=None, dummy2=None):
+	# Object references don't survive loading a file or undo.
+	clear_rig_index()
+	clear_panel_facts()
+
+handlers = (
+	(bpy.app.handlers.depsgraph_update_post, cloudrig_depsgraph_handler)
+	,(bpy.app.handlers.load_post, cloudrig_load_handler)
+	,(bpy.app.handlers.undo_post, cloudrig_load_handler)
+	,(bpy.app.handlers.redo_post, cloudrig_load_handler)
+)
+
+# Custom properties of the armature data which are drawn by the sub-panels of the Settings panel.
+settings_keys = ('ik_switches', 'ik_stretches', 'ik_hinges', 'parents', 'ik_pole_follows', 'fk_hinges', 'face_settings', 'misc_settings')
+
+# Facts about the active object that are shared by the poll() and draw() of every sidebar panel, see get_panel_facts().
+# (Object pointer, validity key, facts)
+panel_facts_memo = (None, None, None)
+
+def clear_panel_facts():
+	global panel_facts_memo
+	panel_facts_memo = (None, None, None)
+
+def get_panel_facts_key(rig):
+	""" Cheap summary of what the panel facts are derived from, so they are rebuilt when the rig is edited by hand, not only when it is re-generated. """
+	return (
+		rig.data.get('cloudrig_generation')
+		,tuple(rig.data.keys())
+		,len(rig.pose.bones)
+		,len(rig.cloud_colors) if hasattr(rig, "cloud_colors") else 0
+	)
+
+def build_panel_facts(rig):
+	""" Return what the panels need to know to decide whether to draw, or None if rig is not a cloudrig of this script. """
+	if rig.data.get('cloudrig') != script_id:
+		return None
+
+	roles = get_roles(rig)
+	return {
+		'settings' : {key for key in settings_keys if key in rig.data}
+		,'multiple_outfits' : len(rig.cloud_rig.items_outfit(bpy.context)) > 1
+		,'outfit_bones' : {name for name in roles['outfits'] if name in rig.pose.bones}
+		,'char_bone' : get_char_bone(rig) is not None
+		,'colors' : hasattr(rig, "cloud_colors") and len(rig.cloud_colors)>0
+	}
+
+def get_panel_facts():
+	""" Return the panel facts of the active object, or None if it is not a cloudrig.
+	They are only derived again when the active object or get_panel_facts_key() changes, so the cost of a redraw doesn't grow with the number of panels.
+	"""
+	global panel_facts_memo
+	o = bpy.context.pose_object or bpy.context.object
+	if not o or o.type != 'ARMATURE':
+		return None
+
+	pointer = o.as_pointer()
+	key = get_panel_facts_key(o)
+	if panel_facts_memo[0] != pointer or panel_facts_memo[1] != key:
+		panel_facts_memo = (pointer, key, build_panel_facts(o))
+	return panel_facts_memo[2]
 
 def active_cloudrig():
 	""" If the active object is a cloudrig, return it. """
-	o = bpy.context.pose_object or bpy.context.object
-	if o and o.type == 'ARMATURE' and 'cloudrig' in o.data and o.data['cloudrig']==script_id:
-		return o
+	if get_panel_facts() is not None:
+		return bpy.context.pose_object or bpy.context.object
+
+def build_roles(rig):
+	""" Bone names by their role, as stored by the generator. Rigs generated before that was stored get the parts this script needs. """
+	if 'cloudrig_roles' in rig.data:
+		return rig.data['cloudrig_roles'].to_dict()
+
+	properties = [b.name for b in rig.pose.bones if b.name.startswith("Properties")]
+	character = [name for name in properties if name.startswith("Properties_Character")]
+	return {
+		'properties' : properties
+		,'character' : character[0] if character else ""
+		,'outfits'	 : [name for name in properties if name.startswith("Properties_Outfit_")]
+	}
+
+def get_roles(rig):
+	return rig_cache(rig, 'roles', build_roles)
+
+def build_layer_rows(rig):
+	""" Rows of (layer index, name) tuples for the Layers panel, as stored by the generator. Rigs generated before that was stored read rigify_layers instead. """
+	if 'cloudrig_layers' in rig.data:
+		return [list(zip(row['indices'], row['names'])) for row in rig.data['cloudrig_layers']]
+
+	# This should work even if the Rigify addon is not enabled.
+	rows = {}
+	for i, rigify_layer in enumerate(rig.data.get('rigify_layers', [])):
+		name = rigify_layer.get('name', "")
+		if name in ["", " "] or name.startswith("$"): continue
+		rows.setdefault(rigify_layer.get('row', 1), []).append((i, name))
+	return [rows[row_index] for row_index in sorted(rows.keys())]
 
 def get_char_bone(rig):
-	for b in rig.pose.bones:
-		if b.name.startswith("Properties_Character"):
-			return b
+	name = get_roles(rig)['character']
+	if name:
+		return rig.pose.bones.get(name)
 
 def get_bones(rig, names):
 	""" Return a list of pose bones from a string of bone names in json format. """
 	return list(filter(None, map(rig.pose.bones.get, json.loads(names))))
 
+# Data derived from each rig's generated data, so it doesn't have to be re-parsed on every redraw.
+# Rig pointer : {"generation" : The rig's generation stamp when the data was derived, key : data}
+rig_caches = {}
+
+def rig_cache(rig, key, build):
+	""" Return build(rig), re-computed only when the rig was re-generated since the last call with this key. """
+	generation = rig.data.get('cloudrig_generation')
+	pointer = rig.as_pointer()
+	cache = rig_caches.get(pointer)
+	if not cache or cache['generation'] != generation:
+		# Drop everything derived from the previous generation.
+		cache = rig_caches[pointer] = {'generation' : generation}
+	if key not in cache:
+		cache[key] = build(rig)
+	return cache[key]
+
+def parse_rig_settings(main_dict):
+	""" Convert a UI data dictionary to a list of rows, each a list of (entry name, info, operator arguments) tuples. """
+	rows = []
+	# Each top-level dictionary within the main dictionary defines a row.
+	for row_name, row_entries in main_dict.items():
+		row = []
+		# Each second-level dictionary within that defines a slider (and operator, if given).
+		# If there is more than one, they will be drawn next to each other, since they're in the same row.
+		for entry_name, info in row_entries.items():
+			assert 'prop_bone' in info and 'prop_id' in info, f"ERROR: Limb definition lacks properties bone or ID: {row_name}, {info}"
+			op_args = []
+			if 'operator' in info:
+				for param, value in info.items():
+					# Lists and Dicts cannot be passed to blender operators, so we must convert them to a string.
+					if type(value) in [list, dict]:
+						value = json.dumps(value)
+					op_args.append((param, value))
+			row.append((entry_name, info, op_args))
+		rows.append(row)
+	return rows
+
 def draw_rig_settings(layout, rig, dict_name, label=""):
 	""" 
 	dict_name is the name of the custom property dictionary that we expect to find in the rig.
 	Everything stored in a single dictionary is drawn in one call of this function.
-	These dictionaries are created during rig generation.
+	These dictionaries are created during rig generation, and parsed once per generation.
 
 	For an example dictionary, select an existing CloudRig, and put this in the PyConsole:
 	>>> import json
@@ -59,16 +236,10 @@ def draw_rig_settings(layout, rig, dict_name, label=""):
 	if label != "":
 		layout.label(text=label)
 
-	main_dict = rig.data[dict_name].to_dict()
-	# Each top-level dictionary within the main dictionary defines a row.
-	for row_name in main_dict.keys():
+	rows = rig_cache(rig, dict_name, lambda rig: parse_rig_settings(rig.data[dict_name].to_dict()))
+	for row_entries in rows:
 		row = layout.row()
-		# Each second-level dictionary within that defines a slider (and operator, if given).
-		# If there is more than one, they will be drawn next to each other, since they're in the same row.
-		row_entries = main_dict[row_name]
-		for entry_name in row_entries.keys():
-			info = row_entries[entry_name]		# This is the lowest level dictionary that contains the parameters for the slider and its operator, if given.
-			assert 'prop_bone' in info and 'prop_id' in info, f"ERROR: Limb definition lacks properties bone or ID: {row_name}, {info}"
+		for entry_name, info, op_args in row_entries:
 			prop_bone = rig.pose.bones.get(info['prop_bone'])
 			prop_id = info['prop_id']
 			assert prop_bone and prop_id in prop_bone, f"ERROR: Properties bone or property does not exist: {info}"
@@ -86,20 +257,143 @@ def draw_rig_settings(layout, rig, dict_name, label=""):
 
 			# Draw an operator if provided.
 			if 'operator' in info:
-				icon = 'FILE_REFRESH'
-				if 'icon' in info:
-					icon = info['icon']
-
+				icon = info.get('icon', 'FILE_REFRESH')
 				operator = sub_row.operator(info['operator'], text="", icon=icon)
 				# Pass on any paramteres to the operator that it will accept.
-				for param in info.keys():
+				for param, value in op_args:
 					if hasattr(operator, param):
-						value = info[param]
-						# Lists and Dicts cannot be passed to blender operators, so we must convert them to a string.
-						if type(value) in [list, dict]:
-							value = json.dumps(value)
 						setattr(operator, param, value)
 
+def get_transform_channels(pose_bone, *, no_loc=False, no_rot=False, no_scale=False):
+	""" Return (property name, index) tuples of the transform channels of a bone that snapping may change, skipping locked channels. """
+	channels = []
+
+	def add_channels(prop, locks):
+		channels.extend((prop, i) for i, lock in enumerate(locks) if not lock)
+
+	if not (no_loc or pose_bone.bone.use_connect):
+		add_channels('location', pose_bone.lock_location)
+
+	if not no_rot:
+		if pose_bone.rotation_mode in ['QUATERNION', 'AXIS_ANGLE']:
+			if pose_bone.lock_rotations_4d:
+				locks = [pose_bone.lock_rotation_w, *pose_bone.lock_rotation]
+			else:
+				locks = [all(pose_bone.lock_rotation)] * 4
+			prop = 'rotation_quaternion' if pose_bone.rotation_mode == 'QUATERNION' else 'rotation_axis_angle'
+			add_channels(prop, locks)
+		else:
+			add_channels('rotation_euler', pose_bone.lock_rotation)
+
+	if not no_scale:
+		add_channels('scale', pose_bone.lock_scale)
+
+	return channels
+
+def write_keyframes(action, data_path, index, group, frames, values, interpolation=None):
+	""" Key the values on the frames of an FCurve in one go. Existing keys on other frames are kept.
+	If an interpolation is given, the keys, and the existing key before the first frame, use it, so there is no blending into the keyed frames either.
+	"""
+	fcurve = action.fcurves.find(data_path, index=index)
+	if not fcurve:
+		fcurve = action.fcurves.new(data_path, index=index, action_group=group)
+
+	points = fcurve.keyframe_points
+	count = len(points)
+	co = [0.0] * (count*2)
+	handle_left = [0.0] * (count*2)
+	handle_right = [0.0] * (count*2)
+	points.foreach_get('co', co)
+	points.foreach_get('handle_left', handle_left)
+	points.foreach_get('handle_right', handle_right)
+
+	# Existing keys on the keyed frames are overwritten in place, so they keep their handle types, easing, etc.
+	# New keys go into the points added at the end, fcurve.update() sorts them.
+	existing = {co[i*2] : i for i in range(count)}
+	keyed_indices = []
+	for frame, value in zip(frames, values):
+		i = existing.get(frame)
+		if i is None:
+			i = len(co) // 2
+			co.extend((frame, value))
+			handle_left.extend((frame, value))
+			handle_right.extend((frame, value))
+		else:
+			# Move the handles along with the key.
+			offset = value - co[i*2+1]
+			co[i*2+1] = value
+			handle_left[i*2+1] += offset
+			handle_right[i*2+1] += offset
+		keyed_indices.append(i)
+
+	if len(co) // 2 > count:
+		points.add(len(co) // 2 - count)
+	points.foreach_set('co', co)
+	points.foreach_set('handle_left', handle_left)
+	points.foreach_set('handle_right', handle_right)
+
+	if interpolation:
+		first_frame = min(frames)
+		before = [i for i in range(count) if co[i*2] < first_frame]
+		if before:
+			keyed_indices.append(max(before, key=lambda i: co[i*2]))
+		for i in keyed_indices:
+			points[i].interpolation = interpolation
+
+	# Sort the keys and re-calculate their handles.
+	fcurve.update()
+
+def bake_snapping(context, rig, frames, bone_names, snap_frame, prop_bone="", prop_id="", *, no_loc=False, no_rot=False, no_scale=False):
+	""" Call snap_frame(context) on each frame, then key the transforms of the bones, and the custom property, on all of those frames at once.
+	The rig is evaluated once per frame, plus whatever snap_frame evaluates. This doesn't need an operator, so it can also be used from a script:
+	>>> bake_snapping(bpy.context, rig, range(1, 1001), ["IK-Hand.L"], my_snap_function, "Properties_IKFK", "ik_hand_left")
+	"""
+	scene = context.scene
+	org_frame = scene.frame_current
+
+	pose_bones = [rig.pose.bones[name] for name in bone_names]
+	# Channels that aren't animated would otherwise keep the values that were snapped on the previous frame.
+	org_bases = [pb.matrix_basis.copy() for pb in pose_bones]
+	prop_owner = rig.pose.bones.get(prop_bone)
+	org_value = prop_owner[prop_id] if prop_owner else None
+
+	# (Pose bone, data path, property name, index) of each channel to key.
+	channels = []
+	for pb in pose_bones:
+		for prop, index in get_transform_channels(pb, no_loc=no_loc, no_rot=no_rot, no_scale=no_scale):
+			channels.append((pb, pb.path_from_id(prop), prop, index))
+	channel_values = [[] for channel in channels]
+	prop_values = []
+
+	frames = list(frames)
+	for frame in frames:
+		for pb, basis in zip(pose_bones, org_bases):
+			pb.matrix_basis = basis
+		if prop_owner:
+			prop_owner[prop_id] = org_value
+		scene.frame_set(frame)
+
+		snap_frame(context)
+
+		for (pb, data_path, prop, index), values in zip(channels, channel_values):
+			values.append(getattr(pb, prop)[index])
+		if prop_owner:
+			prop_values.append(prop_owner[prop_id])
+
+	if not rig.animation_data:
+		rig.animation_data_create()
+	action = rig.animation_data.action
+	if not action:
+		action = rig.animation_data.action = bpy.data.actions.new(rig.name + "Action")
+
+	for (pb, data_path, prop, index), values in zip(channels, channel_values):
+		write_keyframes(action, data_path, index, pb.name, frames, values)
+	if prop_owner:
+		# The switch should happen on the keyed frames, not blend into them.
+		write_keyframes(action, prop_owner.path_from_id(rna_idprop_quote_path(prop_id)), 0, prop_owner.name, frames, prop_values, interpolation='CONSTANT')
+
+	scene.frame_set(org_frame)
+
 class CLOUDRIG_OT_snap_simple(bpy.types.Operator):
 	bl_description = "Toggle a custom property while ensuring that some bones stay in place"
 	bl_idname = "pose.snap_simple"
@@ -112,6 +406,10 @@ class CLOUDRIG_OT_snap_simple(bpy.types.Operator):
 	select_bones: BoolProperty(name="Select Affected Bones", default=True)
 	locks:		  BoolVectorProperty(name="Locked", size=3, default=[False,False,False])
 
+	bake_range:	  BoolProperty(name="Bake Frame Range", description="Snap on every frame of a frame range, and keyframe the result", default=False)
+	frame_start:  IntProperty(name="Start Frame", description="First frame to bake. Defaults to the start of the scene's frame range")
+	frame_end:	  IntProperty(name="End Frame", description="Last frame to bake. Defaults to the end of the scene's frame range")
+
 	@classmethod
 	def poll(cls, context):
 		return context.pose_object
@@ -121,16 +419,16 @@ class CLOUDRIG_OT_snap_simple(bpy.types.Operator):
 		# TODO: Instead of relying on scene settings(auto-keying, keyingset, etc) maybe it would be better to have a custom boolean to decide whether to insert keyframes or not. Ask animators.
 		self.keyflags = self.get_autokey_flags(context, ignore_keyset=True)
 		self.keyflags_switch = self.add_flags_if_set(self.keyflags, {'INSERTKEY_AVAILABLE'})
+		self.switch_value = self.get_switch_value(rig)
 
-		bone_names = json.loads(self.bones)
+		self.bone_names = json.loads(self.bones)
 		bones = get_bones(rig, self.bones)
 
 		try:
-			matrices = []
-			for bone_name in bone_names:
-				matrices.append( self.save_frame_state(context, rig, bone_name) )
-			
-			self.apply_frame_state(context, rig, matrices, bone_names)
+			if self.bake_range:
+				self.bake(context, rig, self.bone_names)
+			else:
+				self.snap_frame(context, rig)
 
 		except Exception as e:
 			traceback.print_exc()
@@ -147,28 +445,96 @@ class CLOUDRIG_OT_snap_simple(bpy.types.Operator):
 			for b in bones:
 				b.bone.select=True
 
+	def invoke(self, context, event):
+		self.set_frame_range(context)
+		return self.execute(context)
+
+	def set_frame_range(self, context):
+		""" Show the scene's frame range as the default range to bake. """
+		if not self.properties.is_property_set('frame_start'):
+			self.frame_start = context.scene.frame_start
+		if not self.properties.is_property_set('frame_end'):
+			self.frame_end = context.scene.frame_end
+
+	def get_switch_value(self, rig):
+		return 1 - self.get_custom_property_value(rig, self.prop_bone, self.prop_id)
+
+	def snap_frame(self, context, rig):
+		matrices = []
+		for bone_name in self.bone_names:
+			matrices.append( self.save_frame_state(context, rig, bone_name) )
+
+		self.apply_frame_state(context, rig, matrices, self.bone_names)
+
+	def bake(self, context, rig, bone_names):
+		""" Snap on every frame of the frame range, then key the bones and the property on all of those frames at once. """
+		scene = context.scene
+		frame_start = self.frame_start if self.properties.is_property_set('frame_start') else scene.frame_start
+		frame_end = self.frame_end if self.properties.is_property_set('frame_end') else scene.frame_end
+		assert frame_start <= frame_end, f"Baking failed: End frame {frame_end} is before start frame {frame_start}."
+
+		# Keys are inserted by bake_snapping() instead of on each frame.
+		self.keyflags = self.keyflags_switch = None
+		bake_snapping(
+			context, rig, range(frame_start, frame_end+1), bone_names,
+			lambda context: self.snap_frame(context, rig),
+			self.prop_bone, self.prop_id,
+			no_loc=self.locks[0], no_rot=self.locks[1], no_scale=self.locks[2]
+		)
+
 	def save_frame_state(self, context, rig, bone):
 		return self.get_transform_matrix(rig, bone, with_constraints=False)
 
 	def apply_frame_state(self, context, rig, old_matrices, bone_names):
 		# Change the parent
-		# TODO: Instead of relying on scene settings(auto-keying, keyingset, etc) maybe it would be better to have a custom boolean to decide whether to insert keyframes or not. Ask animators.
-		value = self.get_custom_property_value(rig, self.prop_bone, self.prop_id)
-
 		self.set_custom_property_value(
-			rig, self.prop_bone, self.prop_id, 1-value,
+			rig, self.prop_bone, self.prop_id, self.switch_value,
 			keyflags=self.keyflags_switch
 		)
 
 		context.view_layer.update()
 
 		# Set the transforms to restore position
-		for i, bone_name in enumerate(bone_names):
-			old_matrix = old_matrices[i]
-			self.set_transform_from_matrix(
-				rig, bone_name, old_matrix, keyflags=self.keyflags,
-				no_loc=self.locks[0], no_rot=self.locks[1], no_scale=self.locks[2]
-			)
+		self.snap_bones(context, rig, bone_names, old_matrices)
+
+	def snap_bone(self, rig, bone_name, matrix):
+		self.set_transform_from_matrix(
+			rig, bone_name, matrix, keyflags=self.keyflags,
+			no_loc=self.locks[0], no_rot=self.locks[1], no_scale=self.locks[2]
+		)
+
+	def dependency_levels(self, rig, bone_names):
+		""" Split the bones into lists, where no bone shares a list with, or comes before, one of its parents or grand-parents. """
+		affected = set(bone_names)
+		levels = {}
+
+		def get_level(bone_name):
+			if bone_name not in levels:
+				levels[bone_name] = 0
+				parent = rig.pose.bones[bone_name].parent
+				while parent:
+					if parent.name in affected:
+						levels[bone_name] = get_level(parent.name) + 1
+						break
+					parent = parent.parent
+			return levels[bone_name]
+
+		grouped = []
+		for bone_name in bone_names:
+			level = get_level(bone_name)
+			while len(grouped) <= level:
+				grouped.append([])
+			grouped[level].append(bone_name)
+		return grouped
+
+	def snap_bones(self, context, rig, bone_names, matrices):
+		""" Give each bone its pose space matrix. The bones are snapped parent-first, and the rig is only evaluated between levels of bones that are parented to each other. """
+		bone_matrices = dict(zip(bone_names, matrices))
+		for i, level in enumerate(self.dependency_levels(rig, bone_names)):
+			if i > 0:
+				context.view_layer.update()
+			for bone_name in level:
+				self.snap_bone(rig, bone_name, bone_matrices[bone_name])
 
 	######################
 	## Keyframing tools ##
@@ -349,43 +715,56 @@ class CLOUDRIG_OT_snap_mapped(CLOUDRIG_OT_snap_simple):
 		self.keyflags_switch = self.add_flags_if_set(self.keyflags, {'INSERTKEY_AVAILABLE'})
 
 		value = self.get_custom_property_value(rig, self.prop_bone, self.prop_id)
+		self.switch_value = 1-value
 		my_map = self.map_off if value==1 else self.map_on
 		names_hide = self.hide_off if value==1 else self.hide_on
 		names_unhide = self.hide_on if value==1 else self.hide_off
 
-		self.set_custom_property_value(
-			rig, self.prop_bone, self.prop_id, 1-value, 
-			keyflags=self.keyflags
-		)
 		my_map = json.loads(my_map)
 
-		names_affected = [t[0] for t in my_map]
-		names_affector = [t[1] for t in my_map]
+		self.names_affected = [t[0] for t in my_map]
+		self.names_affector = [t[1] for t in my_map]
 
-		matrices = []
-		for affector_name in names_affector:
-			affector_bone = rig.pose.bones.get(affector_name)
-			assert affector_bone, f"Error: Snapping failed, bone not found: {affector_name}"
-			matrices.append(affector_bone.matrix.copy())
-
-		for i, affected_name in enumerate(names_affected):
-			affected_bone = rig.pose.bones.get(affected_name)
-			assert affected_bone, f"Error: Snapping failed, bones not found: {affected_name}"
-			affected_bone.matrix = matrices[i]
-			context.evaluated_depsgraph_get().update()
-
-			# Keyframe properties
-			if self.keyflags is not None:
-				self.keyframe_transform_properties(
-					rig, affected_bone.name, self.keyflags,
-					no_loc=self.locks[0], no_rot=self.locks[1], no_scale=self.locks[2]
-				)
+		for affector_name in self.names_affector:
+			assert affector_name in rig.pose.bones, f"Error: Snapping failed, bone not found: {affector_name}"
+		for affected_name in self.names_affected:
+			assert affected_name in rig.pose.bones, f"Error: Snapping failed, bones not found: {affected_name}"
+
+		if self.bake_range:
+			self.bake(context, rig, self.get_baked_bones())
+		else:
+			self.snap_frame(context, rig)
+			context.view_layer.update()
 
 		self.hide_unhide_bones(get_bones(rig, names_hide), get_bones(rig, names_unhide))
-		self.set_selection(context, get_bones(rig, json.dumps(names_affected)))
+		self.set_selection(context, get_bones(rig, json.dumps(self.names_affected)))
 
 		return {'FINISHED'}
 
+	def get_baked_bones(self):
+		return self.names_affected
+
+	def snap_frame(self, context, rig):
+		# Read all the matrices before any bone is moved.
+		matrices = [rig.pose.bones[affector_name].matrix.copy() for affector_name in self.names_affector]
+
+		self.set_custom_property_value(
+			rig, self.prop_bone, self.prop_id, self.switch_value, 
+			keyflags=self.keyflags
+		)
+
+		self.snap_bones(context, rig, self.names_affected, matrices)
+
+	def snap_bone(self, rig, bone_name, matrix):
+		rig.pose.bones[bone_name].matrix = matrix
+
+		# Keyframe properties
+		if self.keyflags is not None:
+			self.keyframe_transform_properties(
+				rig, bone_name, self.keyflags,
+				no_loc=self.locks[0], no_rot=self.locks[1], no_scale=self.locks[2]
+			)
+
 	def hide_unhide_bones(self, hide_bones, unhide_bones):
 		# Hide bones
 		for b in hide_bones:
@@ -417,26 +796,17 @@ class CLOUDRIG_OT_switch_parent(CLOUDRIG_OT_snap_simple):
 		items=lambda s,c: CLOUDRIG_OT_switch_parent.parent_items
 	)
 
-	def apply_frame_state(self, context, rig, old_matrices, bone_names):
-		# Change the parent
-		self.set_custom_property_value(
-			rig, self.prop_bone, self.prop_id, int(self.selected),
-			keyflags=self.keyflags_switch
-		)
-
-		context.view_layer.update()
-
-		# Set the transforms to restore position
-		for i, bone_name in enumerate(bone_names):
-			old_matrix = old_matrices[i]
-			self.set_transform_from_matrix(
-				rig, bone_name, old_matrix, keyflags=self.keyflags,
-				no_loc=self.locks[0], no_rot=self.locks[1], no_scale=self.locks[2]
-			)
+	def get_switch_value(self, rig):
+		return int(self.selected)
 
 	def draw(self, _context):
 		col = self.layout.column()
 		col.prop(self, 'selected', expand=True)
+		col.prop(self, 'bake_range')
+		if self.bake_range:
+			row = col.row(align=True)
+			row.prop(self, 'frame_start')
+			row.prop(self, 'frame_end')
 
 	def invoke(self, context, event):
 		rig = context.pose_object or context.active_object
@@ -457,14 +827,15 @@ class CLOUDRIG_OT_switch_parent(CLOUDRIG_OT_snap_simple):
 		CLOUDRIG_OT_switch_parent.parent_items = pitems
 
 		self.selected = str(pose.bones[self.prop_bone][self.prop_id])
+		self.set_frame_range(context)
 
 		if hasattr(self, 'draw'):
 			return context.window_manager.invoke_props_popup(self, event)
 		else:
 			return self.execute(context)
 
-class CLOUDRIG_OT_ikfk_toggle(bpy.types.Operator):
-	bl_description = "Toggle between IK and FK, and snap the controls accordingly. This will NOT place any keyframes, but it will select the affected bones"
+class CLOUDRIG_OT_ikfk_toggle(CLOUDRIG_OT_snap_mapped):
+	bl_description = "Toggle between IK and FK, and snap the controls accordingly. This will NOT place any keyframes unless a frame range is baked, but it will select the affected bones"
 	bl_idname = "armature.ikfk_toggle"
 	bl_label = "Toggle IK/FK"
 	bl_options = {'REGISTER', 'UNDO'}
@@ -482,18 +853,14 @@ class CLOUDRIG_OT_ikfk_toggle(bpy.types.Operator):
 	double_first_control: BoolProperty(default=False)
 	double_ik_control:	  BoolProperty(default=False)
 
-	@classmethod
-	def poll(cls, context):
-		return context.pose_object
-
 	def execute(self, context):
 		armature = context.pose_object
 
-		fk_chain = get_bones(armature, self.fk_chain)
-		ik_chain = get_bones(armature, self.ik_chain)
+		self.fk_bones = fk_chain = get_bones(armature, self.fk_chain)
+		self.ik_bones = ik_chain = get_bones(armature, self.ik_chain)
 		str_chain = get_bones(armature, self.str_chain)
 
-		ik_pole = armature.pose.bones.get(self.ik_pole)	# Can be None.
+		self.pole_bone = ik_pole = armature.pose.bones.get(self.ik_pole)	# Can be None.
 		ik_control = armature.pose.bones.get(self.ik_control)
 		assert ik_control, "ERROR: Could not find IK Control: " + self.ik_control
 
@@ -515,32 +882,15 @@ class CLOUDRIG_OT_ikfk_toggle(bpy.types.Operator):
 
 		prop_bone = armature.pose.bones.get(self.prop_bone)
 		value = prop_bone[self.prop_id]
-		if value==0:
-			# Snap the last IK control to the last FK control.
-			first_ik_bone = ik_chain[0]
-			last_ik_bone = ik_chain[-1]
-			first_fk_bone = fk_chain[-2].parent
-			if ik_pole:
-				self.match_pole_target(first_ik_bone, last_ik_bone, ik_pole, first_fk_bone, 0.5)
-			else:
-				if first_ik_bone.rotation_mode == first_fk_bone.rotation_mode:
-					first_ik_bone.location = first_fk_bone.location.copy()
-					first_ik_bone.rotation_euler = first_fk_bone.rotation_euler.copy()
-				else:
-					first_ik_bone.matrix = first_fk_bone.matrix.copy()
-			context.evaluated_depsgraph_get().update()
+		self.to_ik = value==0
 
-		bpy.ops.pose.snap_mapped(
-			prop_bone = self.prop_bone,
-			prop_id = self.prop_id,
+		self.map_on		= json.dumps(map_on)
+		self.map_off	= json.dumps(map_off)
+		self.hide_on	= json.dumps(hide_on)
+		self.hide_off	= json.dumps(hide_off)
+		self.select_bones = True
 
-			map_on		= json.dumps(map_on), 
-			map_off		= json.dumps(map_off), 
-			hide_on		= json.dumps(hide_on), 
-			hide_off	= json.dumps(hide_off),
-
-			select_bones = True,
-		)
+		super().execute(context)
 
 		if value==0 and ik_pole:
 			# Select pole
@@ -548,22 +898,31 @@ class CLOUDRIG_OT_ikfk_toggle(bpy.types.Operator):
 
 		return {'FINISHED'}
 
-	def perpendicular_vector(self, v):
-		""" Returns a vector that is perpendicular to the one given.
-			The returned vector is _not_ guaranteed to be normalized.
-		"""
-		# Create a vector that is not aligned with v.
-		# It doesn't matter what vector.  Just any vector
-		# that's guaranteed to not be pointing in the same
-		# direction.
-		if abs(v[0]) < abs(v[1]):
-			tv = Vector((1,0,0))
+	def get_baked_bones(self):
+		bone_names = super().get_baked_bones()
+		if self.to_ik and self.pole_bone:
+			bone_names = bone_names + [self.pole_bone.name]
+		return bone_names
+
+	def snap_frame(self, context, rig):
+		if self.to_ik:
+			self.snap_ik_root()
+		super().snap_frame(context, rig)
+
+	def snap_ik_root(self):
+		""" Place the pole target, or if there is none, the first IK bone, to match the FK chain. """
+		first_ik_bone = self.ik_bones[0]
+		first_fk_bone = self.fk_bones[-2].parent
+		if self.pole_bone:
+			# The IK control will be snapped to the last FK bone, so that is where the IK goal will be.
+			self.match_pole_target(self.ik_bones, self.pole_bone, first_fk_bone, self.fk_bones[-1].head, 0.5)
 		else:
-			tv = Vector((0,1,0))
-
-		# Use cross prouct to generate a vector perpendicular to
-		# both tv and (more importantly) v.
-		return v.cross(tv)
+			if first_ik_bone.rotation_mode == first_fk_bone.rotation_mode:
+				first_ik_bone.location = first_fk_bone.location.copy()
+				first_ik_bone.rotation_euler = first_fk_bone.rotation_euler.copy()
+			else:
+				first_ik_bone.matrix = first_fk_bone.matrix.copy()
+		# No evaluation is needed here, since snap_mapped only reads the FK bones, which don't depend on the IK chain.
 
 	def set_pose_translation(self, pose_bone, mat):
 		""" Sets the pose bone's translation to the same translation as the given matrix.
@@ -610,69 +969,40 @@ class CLOUDRIG_OT_ikfk_toggle(bpy.types.Operator):
 
 		return smat
 
-	def rotation_difference(self, mat1, mat2):
-		""" Returns the shortest-path rotational difference between two
-			matrices.
-		"""
-		q1 = mat1.to_quaternion()
-		q2 = mat2.to_quaternion()
-		angle = acos(min(1,max(-1,q1.dot(q2)))) * 2
-		if angle > radians(90):
-			angle = -angle + radians(180)
-		return angle
-
-	def match_pole_target(self, ik_first, ik_last, pole, match_bone, length):
-		""" Places an IK chain's pole target to match ik_first's
-			transforms to match_bone.  All bones should be given as pose bones.
-			You need to be in pose mode on the relevant armature object.
-			ik_first: first bone in the IK chain
-			ik_last:  last bone in the IK chain
-			pole:  pole target bone for the IK chain
-			match_bone:  bone to match ik_first to (probably first bone in a matching FK chain)
-			length:  distance pole target should be placed from the chain center
+	def match_pole_target(self, ik_chain, pole, match_bone, goal, length):
+		""" Place an IK chain's pole target so that the IK chain's first bone lines up with match_bone.
+			Blender's IK solver rotates the chain around the line from its root to the IK goal,
+			until the first bone's X axis, rotated towards its Z axis by the IK constraint's pole_angle, points at the pole target.
+			So the pole target can be placed from match_bone's axes, without evaluating the rig.
+			ik_chain:	IK bones, the IK constraint owner among them
+			pole:		pole target bone of the IK constraint
+			match_bone:	bone to match the first IK bone to (probably first bone in a matching FK chain)
+			goal:		armature space position that the IK goal will be at
+			length:		distance pole target should be placed from the chain center
 		"""
-		a = ik_first.matrix.to_translation()
-		b = ik_last.matrix.to_translation() + ik_last.vector
-
-		# Vector from the head of ik_first to the
-		# tip of ik_last
-		ikv = b - a
-
-		# Get a vector perpendicular to ikv
-		pv = self.perpendicular_vector(ikv).normalized() * length
-
-		def set_pole(pvi):
-			""" Set pole target's position based on a vector
-				from the arm center line.
-			"""
-			# Translate pvi into armature space
-			ploc = a + (ikv/2) + pvi
-
-			# Set pole target to location
-			mat = self.get_pose_matrix_in_other_space(Matrix.Translation(ploc), pole)
-			self.set_pose_translation(pole, mat)
-
-			org_mode = bpy.context.object.mode
-			bpy.ops.object.mode_set(mode='OBJECT')
-			bpy.ops.object.mode_set(mode=org_mode)
-
-		set_pole(pv)
-
-		# Get the rotation difference between ik_first and match_bone
-		angle = self.rotation_difference(ik_first.matrix, match_bone.matrix)
-
-		# Try compensating for the rotation difference in both directions
-		pv1 = Matrix.Rotation(angle, 4, ikv) @ pv
-		set_pole(pv1)
-		tail_dist1 = (ik_first.tail - match_bone.tail).length
-
-		pv2 = Matrix.Rotation(-angle, 4, ikv) @ pv
-		set_pole(pv2)
-		tail_dist2 = (ik_first.tail - match_bone.tail).length
-
-		# Do the one with the smaller angle
-		if tail_dist1 < tail_dist2:
-			set_pole(pv1)
+		pole_angle = 0
+		for ik_bone in ik_chain:
+			for c in ik_bone.constraints:
+				if c.type == 'IK' and c.pole_subtarget == pole.name:
+					pole_angle = c.pole_angle
+
+		root = match_bone.head
+		chain_vector = goal - root
+		axis = chain_vector.normalized()
+		basis = match_bone.matrix.to_3x3().normalized()
+
+		up = basis.col[0] * cos(pole_angle) + basis.col[2] * sin(pole_angle)
+		# Only the direction perpendicular to the chain matters to the IK solver.
+		up = up - axis * up.dot(axis)
+		if up.length < 0.0001:
+			print(f"WARNING: Could not match pole target {pole.name}, since {match_bone.name} is pointing at the IK goal.")
+			return
+
+		pole_loc = root + (chain_vector/2) + up.normalized() * length
+
+		# Set pole target to location
+		mat = self.get_pose_matrix_in_other_space(Matrix.Translation(pole_loc), pole)
+		self.set_pose_translation(pole, mat)
 
 class CLOUDRIG_OT_reset_colors(bpy.types.Operator):
 	bl_description = "Reset rig color properties to their stored default"
@@ -716,39 +1046,59 @@ class CloudRig_ColorProperties(bpy.types.PropertyGroup):
 		options={'LIBRARY_EDITABLE'}	# Make it not animatable.
 	)
 
+# If no outfits were found, don't return an empty list so the console doesn't spam "'0' matches no enum" warnings.
+default_outfit_items = [('0', 'Default', 'Default')]
+
+# Outfit EnumProperty items of each rig, see items_outfit().
+# Blender keeps referencing the strings of the returned items, so entries are only ever replaced by items_outfit() itself, and never cleared along with rig_caches.
+# Rig pointer : (Generation stamp, items)
+outfit_items_store = {}
+
+def build_outfit_items(rig):
+	""" Convert the list of outfits into what an EnumProperty expects. """
+	outfits = [name.replace("Properties_Outfit_", "") for name in get_roles(rig)['outfits']]
+	# Identifier, name, description, can all be the outfit name.
+	items = [(outfit, outfit, outfit, i) for i, outfit in enumerate(outfits)]
+	return items or default_outfit_items
+
+def build_outfit_links(rig):
+	""" Return a dictionary of outfit bone name : List of (outfit property, character property) pairs,
+	for outfit properties starting with "_", which set the character property of the same name when the outfit is selected.
+	"""
+	char_bone = get_char_bone(rig)
+	if not char_bone: return {}
+
+	links = {}
+	for bone_name in get_roles(rig)['outfits']:
+		outfit_bone = rig.pose.bones.get(bone_name)
+		if not outfit_bone: continue
+		links[bone_name] = [(key, key[1:]) for key in outfit_bone.keys() if key.startswith("_") and key[1:] in char_bone]
+	return links
+
 class CloudRig_Properties(bpy.types.PropertyGroup):
 	""" PropertyGroup for storing fancy custom properties in. """
 
 	def get_rig(self):
-		""" Find the armature object that is using this instance (self). """
-
-		for rig in get_rigs():
-			if rig.cloud_rig == self:
-				return rig
+		""" Return the armature object that is using this instance (self). """
+		rig = self.id_data
+		if rig.type=='ARMATURE' and 'cloudrig' in rig.data:
+			return rig
 
 	def items_outfit(self, context):
 		""" Items callback for outfits EnumProperty.
-			Build and return a list of outfit names based on a bone naming convention.
+			Return a list of outfit names based on a bone naming convention.
 			Bones storing an outfit's properties must be named "Properties_Outfit_OutfitName".
 		"""
 		rig = self.get_rig()
-		if not rig: return [(('0', 'Default', 'Default'))]
+		if not rig: return default_outfit_items
 
-		outfits = []
-		for b in rig.pose.bones:
-			if b.name.startswith("Properties_Outfit_"):
-				outfits.append(b.name.replace("Properties_Outfit_", ""))
-
-		# Convert the list into what an EnumProperty expects.
-		items = []
-		for i, outfit in enumerate(outfits):
-			items.append((outfit, outfit, outfit, i))	# Identifier, name, description, can all be the outfit name.
-
-		# If no outfits were found, don't return an empty list so the console doesn't spam "'0' matches no enum" warnings.
-		if items==[]:
-			return [(('0', 'Default', 'Default'))]
-
-		return items
+		# Blender needs the returned strings to stay alive, which the store takes care of.
+		pointer = rig.as_pointer()
+		generation = rig.data.get('cloudrig_generation')
+		stored = outfit_items_store.get(pointer)
+		if not stored or stored[0] != generation:
+			stored = outfit_items_store[pointer] = (generation, build_outfit_items(rig))
+		return stored[1]
 
 	def change_outfit(self, context):
 		""" Update callback of outfits EnumProperty. """
@@ -762,17 +1112,12 @@ class CloudRig_Properties(bpy.types.PropertyGroup):
 		outfit_bone = rig.pose.bones.get("Properties_Outfit_"+self.outfit)
 
 		if outfit_bone:
-			# Reset all settings to default.
-			for key in outfit_bone.keys():
-				value = outfit_bone[key]
-				if type(value) in [float, int]:
-					pass # TODO: Can't seem to reset custom properties to their default, or even so much as read their default!?!?
+			# TODO: Reset all settings to default. Can't seem to reset custom properties to their default, or even so much as read their default!?!?
 
 			# For outfit properties starting with "_", update the corresponding character property.
 			char_bone = get_char_bone(rig)
-			for key in outfit_bone.keys():
-				if key.startswith("_") and key[1:] in char_bone:
-					char_bone[key[1:]] = outfit_bone[key]
+			for outfit_key, char_key in rig_cache(rig, 'outfit_links', build_outfit_links).get(outfit_bone.name, []):
+				char_bone[char_key] = outfit_bone[outfit_key]
 
 		context.evaluated_depsgraph_get().update()
 
@@ -784,6 +1129,35 @@ class CloudRig_Properties(bpy.types.PropertyGroup):
 		options	= {"LIBRARY_EDITABLE"} # Make it not animatable.
 	)
 
+def parse_prop_hierarchy(prop_owner):
+	""" Parse the 'prop_hierarchy' property of a properties bone, which describes which properties are only drawn when another property has certain values.
+	Example entry: {'Jacket-23' : ['Hood', 'Belt']} This would mean Hood and Belt are only visible when Jacket is either 2 or 3.
+	Without values, eg. {'Jacket' : ['Hood']}, the children are visible when the parent is 1.
+	The generator stores it as a dictionary. Older rigs may store the same dictionary as a string, which is parsed without executing it.
+	Return a list of (parent property, values which show its children, child properties), and a sorted list of the remaining properties to draw.
+	"""
+	hierarchy = prop_owner.get('prop_hierarchy', {})
+	if type(hierarchy) == str:
+		hierarchy = ast.literal_eval(hierarchy)
+	elif hasattr(hierarchy, 'to_dict'):
+		hierarchy = hierarchy.to_dict()
+
+	entries = []
+	in_hierarchy = set()
+	for parent_prop_name, children in hierarchy.items():
+		values = {1}
+		if '-' in parent_prop_name:
+			parent_prop_name, value_digits = parent_prop_name.split('-')
+			values = {int(val) for val in value_digits}	# Convert them to an int set ( eg. '23' -> {2, 3} )
+		entries.append((parent_prop_name, values, list(children)))
+		in_hierarchy.add(parent_prop_name)
+		# Child props are done regardless of whether they were drawn or not, since if the parent is disabled, we don't want to draw them.
+		in_hierarchy.update(children)
+
+	in_hierarchy.add('prop_hierarchy')
+	other_props = [prop_id for prop_id in sorted(prop_owner.keys()) if not prop_id.startswith("_") and prop_id not in in_hierarchy]
+	return entries, other_props
+
 class CLOUDRIG_PT_main(bpy.types.Panel):
 	bl_space_type = 'VIEW_3D'
 	bl_region_type = 'UI'
@@ -791,7 +1165,7 @@ class CLOUDRIG_PT_main(bpy.types.Panel):
 
 	@classmethod
 	def poll(cls, context):
-		return active_cloudrig() is not None
+		return get_panel_facts() is not None
 
 	def draw(self, context):
 		layout = self.layout
@@ -802,18 +1176,15 @@ class CLOUDRIG_PT_character(CLOUDRIG_PT_main):
 
 	@classmethod
 	def poll(cls, context):
-		if not super().poll(context):
+		facts = get_panel_facts()
+		if not facts:
 			return False
 
 		# Only display this panel if there is either an outfit with options, multiple outfits, or character options.
+		if facts['multiple_outfits'] or facts['char_bone']:
+			return True
 		rig = active_cloudrig()
-		if not rig: return
-		rig_props = rig.cloud_rig
-		multiple_outfits = len(rig_props.items_outfit(context)) > 1
-		outfit_properties_bone = rig.pose.bones.get("Properties_Outfit_"+rig_props.outfit)
-		char_bone = get_char_bone(rig)
-
-		return multiple_outfits or outfit_properties_bone or char_bone
+		return "Properties_Outfit_"+rig.cloud_rig.outfit in facts['outfit_bones']
 
 	def draw(self, context):
 		layout = self.layout
@@ -822,8 +1193,7 @@ class CLOUDRIG_PT_character(CLOUDRIG_PT_main):
 		rig_props = rig.cloud_rig
 
 		def add_props(prop_owner):
-			props_done = []
-			bool_props = []		# Not implemented.
+			props_done = set()
 
 			def get_text(prop_id, value):
 				""" If there is a property on prop_owner named $prop_id, expect it to be a list of strings and return the valueth element."""
@@ -838,12 +1208,9 @@ class CLOUDRIG_PT_character(CLOUDRIG_PT_main):
 					return text
 
 			def add_prop(layout, prop_owner, prop_id):
-				if prop_id in props_done: return
+				if prop_id in props_done or prop_id not in prop_owner: return
 
-				if(prop_id in bool_props):
-					bp = bool_props[prop_id]
-					layout.prop(bp, 'value', toggle=True, text=bp.name, icon='TRIA_DOWN' if parent_prop_value in values else 'TRIA_RIGHT')
-				elif type(prop_owner[prop_id]) in [int, float]:
+				if type(prop_owner[prop_id]) in [int, float]:
 					layout.prop(prop_owner, '["'+prop_id+'"]', slider=True, 
 						text = get_text(prop_id, prop_owner[prop_id])
 					)
@@ -851,45 +1218,26 @@ class CLOUDRIG_PT_character(CLOUDRIG_PT_main):
 					# Vectors
 					layout.prop(prop_owner, '["'+prop_id+'"]', text=prop_id.replace("_", " "))
 
+			# Properties can be added or removed by hand after generation.
+			prop_ids = tuple(prop_owner.keys())
+			hierarchy, other_props = rig_cache(rig, ('prop_hierarchy', prop_owner.name, prop_ids), lambda rig: parse_prop_hierarchy(prop_owner))
+
 			# Drawing properties with hierarchy
-			if 'prop_hierarchy' in prop_owner:
-				prop_hierarchy = eval(prop_owner['prop_hierarchy'])
-
-				for parent_prop_name in prop_hierarchy.keys():
-					parent_prop_name_without_values = parent_prop_name
-					values = [1]	# Values which this property needs to be for its children to show. For bools this is always 1.
-					# Example entry in prop_hierarchy: ['Jacket-23' : ['Hood', 'Belt']] This would mean Hood and Belt are only visible when Jacket is either 2 or 3.
-					if('-' in parent_prop_name):
-						split = parent_prop_name.split('-')
-						parent_prop_name_without_values = split[0]
-						values = [int(val) for val in split[1]]	# Convert them to an int list ( eg. '23' -> [2, 3] )
-
-					parent_prop_value = prop_owner[parent_prop_name_without_values]
-
-					# Drawing parent prop, if it wasn't drawn yet.
-					add_prop(layout, prop_owner, parent_prop_name_without_values)
-
-					# Marking parent prop as done drawing.
-					props_done.append(parent_prop_name_without_values)
-
-					# Checking if we should draw children.
-					if(parent_prop_value not in values): continue
-
-					# Drawing children.
-					childrens_box = layout.box()
-					for child_prop_name in prop_hierarchy[parent_prop_name]:
-						add_prop(childrens_box, prop_owner, child_prop_name)
-					
-				# Marking child props as done drawing. (Regardless of whether they were actually drawn or not, since if the parent is disabled, we don't want to draw them.)
-				for parent in prop_hierarchy.keys():
-					for child in prop_hierarchy[parent]:
-						props_done.append(child)
+			for parent_prop_name, values, children in hierarchy:
+				# Drawing parent prop, if it wasn't drawn yet.
+				add_prop(layout, prop_owner, parent_prop_name)
+				props_done.add(parent_prop_name)
 
-			# Drawing properties without hierarchy
-			for prop_id in sorted(prop_owner.keys()):
-				if prop_id.startswith("_"): continue
-				if prop_id in props_done: continue
+				# Checking if we should draw children.
+				if prop_owner.get(parent_prop_name) not in values: continue
 
+				# Drawing children.
+				childrens_box = layout.box()
+				for child_prop_name in children:
+					add_prop(childrens_box, prop_owner, child_prop_name)
+
+			# Drawing properties without hierarchy
+			for prop_id in other_props:
 				add_prop(layout, prop_owner, prop_id)
 
 		# Add character properties to the UI, if any.
@@ -909,29 +1257,16 @@ class CLOUDRIG_PT_layers(CLOUDRIG_PT_main):
 	bl_label = "Layers"
 
 	def draw(self, context):
-		""" Draw rig layer toggles based on data stored in rig.data.rigify_layers. """
+		""" Draw rig layer toggles based on the layer layout stored by the generator. """
 		rig = active_cloudrig()
 		if not rig: return
 		data = rig.data
-		# This should work even if the Rigify addon is not enabled.
-		rigify_layers = data['rigify_layers']
 
 		layout = self.layout
-		for i, l in enumerate(rigify_layers):
-			# When the Rigify addon is not enabled, finding the original index after sorting is impossible, so just store it.
-			l['index'] = i
-
-		sorted_layers = sorted(rigify_layers, key=lambda l: l['row'])
-		sorted_layers = [l for l in sorted_layers if l.name!=" "]
-		current_row_index = 0
-		for rigify_layer in sorted_layers:
-			if rigify_layer['name'] in ["", " "]: continue
-			if rigify_layer['name'].startswith("$"): continue
-
-			if rigify_layer['row'] > current_row_index:
-				current_row_index = rigify_layer['row']
-				row = layout.row()
-			row.prop(data, 'layers', index=rigify_layer['index'], toggle=True, text=rigify_layer['name'])
+		for layer_row in rig_cache(rig, 'layer_rows', build_layer_rows):
+			row = layout.row()
+			for index, name in layer_row:
+				row.prop(data, 'layers', index=index, toggle=True, text=name)
 
 class CLOUDRIG_PT_settings(CLOUDRIG_PT_main):
 	bl_idname = "CLOUDRIG_PT_settings_" + script_id
@@ -944,8 +1279,8 @@ class CLOUDRIG_PT_fkik(CLOUDRIG_PT_main):
 
 	@classmethod
 	def poll(cls, context):
-		rig = active_cloudrig()
-		return rig and "ik_switches" in rig.data
+		facts = get_panel_facts()
+		return facts and "ik_switches" in facts['settings']
 
 	def draw(self, context):
 		layout = self.layout
@@ -961,11 +1296,11 @@ class CLOUDRIG_PT_ik(CLOUDRIG_PT_main):
 
 	@classmethod
 	def poll(cls, context):
-		rig = active_cloudrig()
-		if not rig: return False
+		facts = get_panel_facts()
+		if not facts: return False
 		ik_settings = ['ik_stretches', 'ik_hinges', 'parents', 'ik_pole_follows']
 		for ik_setting in ik_settings:
-			if ik_setting in rig.data:
+			if ik_setting in facts['settings']:
 				return True
 		return False
 
@@ -986,11 +1321,11 @@ class CLOUDRIG_PT_fk(CLOUDRIG_PT_main):
 
 	@classmethod
 	def poll(cls, context):
-		rig = active_cloudrig()
-		if not rig: return False
+		facts = get_panel_facts()
+		if not facts: return False
 		fk_settings = ['fk_hinges']
 		for fk_setting in fk_settings:
-			if fk_setting in rig.data:
+			if fk_setting in facts['settings']:
 				return True
 		return False
 
@@ -1008,8 +1343,8 @@ class CLOUDRIG_PT_face(CLOUDRIG_PT_main):
 
 	@classmethod
 	def poll(cls, context):
-		rig = active_cloudrig()
-		return rig and "face_settings" in rig.data
+		facts = get_panel_facts()
+		return facts and "face_settings" in facts['settings']
 
 	def draw(self, context):
 		layout = self.layout
@@ -1038,8 +1373,8 @@ class CLOUDRIG_PT_misc(CLOUDRIG_PT_main):
 
 	@classmethod
 	def poll(cls, context):
-		rig = active_cloudrig()
-		return rig and "misc_settings" in rig.data
+		facts = get_panel_facts()
+		return facts and "misc_settings" in facts['settings']
 
 	def draw(self, context):
 		layout = self.layout
@@ -1060,8 +1395,8 @@ class CLOUDRIG_PT_viewport(CLOUDRIG_PT_main):
 
 	@classmethod
 	def poll(cls, context):
-		rig = active_cloudrig()
-		return rig and hasattr(rig, "cloud_colors") and len(rig.cloud_colors)>0
+		facts = get_panel_facts()
+		return facts and facts['colors']
 
 	def draw(self, context):
 		layout = self.layout
@@ -1074,9 +1409,9 @@ class CLOUDRIG_PT_viewport(CLOUDRIG_PT_main):
 
 classes = (
 	CLOUDRIG_OT_switch_parent,
-	CLOUDRIG_OT_snap_mapped,	# NOTE: For some reason, if the operators inheriting from snap_simple aren't registered before it, blender complains.
+	CLOUDRIG_OT_ikfk_toggle,	# NOTE: For some reason, if the operators inheriting from snap_simple aren't registered before it, blender complains.
+	CLOUDRIG_OT_snap_mapped,
 	CLOUDRIG_OT_snap_simple,
-	CLOUDRIG_OT_ikfk_toggle,
 	CLOUDRIG_OT_reset_colors,
 
 	CloudRig_ColorProperties,
@@ -1093,11 +1428,23 @@ classes = (
 	CLOUDRIG_PT_viewport,
 )
 
+def remove_handlers():
+	""" This script is executed again whenever a rig is generated, so remove the handlers of previous executions by name. """
+	for handler_list, handler in handlers:
+		for h in handler_list[:]:
+			if getattr(h, '__name__', "") == handler.__name__ and getattr(h, 'script_id', "") == script_id:
+				handler_list.remove(h)
+
 def register():
 	from bpy.utils import register_class
 	for c in classes:
 		register_class(c)
 
+	remove_handlers()
+	for handler_list, handler in handlers:
+		handler.script_id = script_id
+		handler_list.append(handler)
+
 	# We store everything in Object rather than Armature because Armature data cannot be accessed on proxy armatures.
 	bpy.types.Object.cloud_rig = PointerProperty(type=CloudRig_Properties)
 	# TODO: move this inside cloud_rig.colors?
@@ -1108,6 +1455,8 @@ def unregister():
 	for c in classes:
 		unregister_class(c)
 
+	remove_handlers()
+
 	del bpy.types.Object.cloud_rig
 	del bpy.types.Object.cloud_colors
 
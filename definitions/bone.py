@@ -67,6 +67,8 @@ class BoneInfoContainer(ID):
 		self.armature = cloudrig.obj
 		self.defaults = cloudrig.defaults	# For overriding arbitrary properties' default values when creating bones in this container.
 		self.scale = cloudrig.scale
+		# Bones are created with the layer list of their bone set, and each bone set has its own list, so that identifies the bone set a bone was created in.
+		self.bone_set_of_layers = {id(layers) : ui_name for ui_name, layers in cloudrig.bone_layers.items()}
 
 	def find(self, name):
 		"""Find a BoneInfo instance by name, return it if found."""
@@ -85,6 +87,8 @@ class BoneInfoContainer(ID):
 			self.bones.remove(bi)
 
 		bi = BoneInfo(self, name, source, bone_group, **kwargs)
+		if 'layers' in kwargs and 'bone_set' not in kwargs:
+			bi.bone_set = self.bone_set_of_layers.get(id(kwargs['layers']))
 		self.bones.append(bi)
 		return bi
 	
@@ -237,6 +241,7 @@ class BoneInfo(ID):
 		### Bone properties
 		self.name = name
 		self.layers = [l==0 for l in range(32)]	# 32 bools where only the first one is True.
+		self.bone_set = None		# Name of the bone set of the rig that this bone was created in, if any. See CloudBaseRig.add_bone_set().
 		self.rotation_mode = 'QUATERNION'
 		self.hide_select = False
 		self.hide = False
@@ -440,12 +445,6 @@ class BoneInfo(ID):
 		"""Write relevant data into an EditBone."""
 		assert armature.mode == 'EDIT', "Error: Armature must be in Edit Mode when writing edit bone data."
 
-		# Check for 0-length bones.
-		if (self.head - self.tail).length == 0:
-			# Warn and force length.
-			print("WARNING: Had to force 0-length bone to have some length: " + self.name)
-			self.tail = self.head+Vector((0, 0.1, 0))
-
 		### Edit Bone properties
 		eb = edit_bone
 		eb.use_connect = False	# NOTE: Without this, ORG- bones' Copy Transforms constraints can't work properly.
@@ -456,6 +455,21 @@ class BoneInfo(ID):
 			else:
 				eb.parent = armature.data.edit_bones.get(self.parent.name)
 
+		self.write_edit_geometry(eb)
+
+		# Custom Properties.
+		for key, prop in self.custom_props_edit.items():
+			prop.make_real(edit_bone)
+
+	def write_edit_geometry(self, edit_bone):
+		"""Write only the shape of the bone into an EditBone, eg. when re-fitting an existing rig."""
+		# Check for 0-length bones.
+		if (self.head - self.tail).length == 0:
+			# Warn and force length.
+			print("WARNING: Had to force 0-length bone to have some length: " + self.name)
+			self.tail = self.head+Vector((0, 0.1, 0))
+
+		eb = edit_bone
 		eb.head = self.head.copy()
 		eb.tail = self.tail.copy()
 		eb.roll = self.roll
@@ -471,9 +485,11 @@ class BoneInfo(ID):
 		eb.bbone_scaleoutx = self.bbone_scaleoutx
 		eb.bbone_scaleouty = self.bbone_scaleouty
 
-		# Custom Properties.
-		for key, prop in self.custom_props_edit.items():
-			prop.make_real(edit_bone)
+		eb.bbone_x = self._bbone_x
+		eb.bbone_z = self._bbone_z
+		eb.envelope_distance = self.envelope_distance
+		eb.head_radius = self.head_radius
+		eb.tail_radius = self.tail_radius
 
 	def write_pose_data(self, pose_bone):
 		"""Write relevant data into a PoseBone."""
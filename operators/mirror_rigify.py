@@ -1,13 +1,77 @@
 import bpy
+import numpy as np
 from ..rigs import cloud_utils
+from ..rigs.naming import flip_constraint_name, flip_data_path, mirror_pairs
+from ..utils import copy_attributes
+from ..definitions.driver import Driver
 
-def copy_rigify_params(from_bone, to_bone):
+# Writable rigify parameters for each RigifyParameters class, as (identifier, is_string) tuples.
+# The parameter set only changes when rig types are (un)registered, so this is built on first use.
+rigify_param_schemas = {}
+
+def get_rigify_param_schema(params):
+	key = type(params)
+	schema = rigify_param_schemas.get(key)
+	if schema is None:
+		schema = {}
+		for prop in params.bl_rna.properties:
+			if prop.identifier == 'rna_type' or prop.is_readonly: continue
+			if prop.type in ('POINTER', 'COLLECTION'): continue
+			schema[prop.identifier] = (prop.type == 'STRING', getattr(prop, 'is_array', False))
+		rigify_param_schemas[key] = schema
+	return schema
+
+def copy_rigify_params(from_bone, to_bone, flip_strings=False):
+	""" Copy rigify type and the parameters that are set on either bone.
+	flip_strings: Flip the side of string parameters, since those are often bone names.
+	"""
 	to_bone.rigify_type = from_bone.rigify_type
-	for key, value in from_bone.rigify_parameters.items():
-		try:
-			setattr(to_bone.rigify_parameters, key, getattr(from_bone.rigify_parameters, key))
-		except:
-			pass
+	from_params = from_bone.rigify_parameters
+	to_params = to_bone.rigify_parameters
+	schema = get_rigify_param_schema(from_params)
+
+	for key in set(from_params.keys()) | set(to_params.keys()):
+		if key not in schema: continue
+		if key not in from_params:
+			# Parameter is only set on the target bone, reset it to its default.
+			to_params.property_unset(key)
+			continue
+		is_string, is_array = schema[key]
+		value = getattr(from_params, key)
+		if is_array:
+			value = value[:]
+		elif is_string and flip_strings:
+			value = cloud_utils.flip_name(value)
+		setattr(to_params, key, value)
+
+# Edit bone properties that are mirrored across the X axis in one go, with the sign applied per component.
+MIRROR_VECTOR_PROPS = ('head', 'tail')
+MIRROR_VECTOR_SIGN = np.array([-1, 1, 1], dtype=np.float32)
+MIRROR_FLOAT_PROPS = {
+	'roll' : -1
+	,'bbone_x' : 1
+	,'bbone_z' : 1
+	,'bbone_curveinx' : -1
+	,'bbone_curveoutx' : -1
+	,'bbone_curveiny' : 1	# Renamed to bbone_curveinz in Blender 3.0.
+	,'bbone_curveouty' : 1
+	,'bbone_curveinz' : 1
+	,'bbone_curveoutz' : 1
+	,'bbone_rollin' : -1
+	,'bbone_rollout' : -1
+	,'bbone_easein' : 1
+	,'bbone_easeout' : 1
+	,'envelope_distance' : 1
+	,'head_radius' : 1
+	,'tail_radius' : 1
+}
+# Edit bone properties that are copied as they are, one bone at a time.
+COPY_PROPS = ('use_connect', 'use_deform', 'bbone_segments', 'inherit_scale', 'use_inherit_rotation', 'use_local_location', 'layers')
+
+def existing_edit_bone_props(props):
+	""" Return the properties that exist on EditBone in the running Blender version, since foreach_get() and foreach_set() fail on any other. """
+	existing = bpy.types.EditBone.bl_rna.properties.keys()
+	return [prop for prop in props if prop in existing]
 
 class MirrorRigifyParameters(bpy.types.Operator):
 	"""Mirror rigify type and parameters of selected bones"""
@@ -33,7 +97,7 @@ class MirrorRigifyParameters(bpy.types.Operator):
 				print(f"Bone {pb.name} selected on both sides, mirroring would be ambiguous, skipping. (Only select the left or right side, not both!)")
 				continue
 			
-			copy_rigify_params(pb, flip_bone)
+			copy_rigify_params(pb, flip_bone, flip_strings=True)
 
 		return { 'FINISHED' }
 
@@ -59,12 +123,154 @@ class CopyRigifyParameters(bpy.types.Operator):
 
 		return { 'FINISHED' }
 
+class SymmetrizeMetarig(bpy.types.Operator):
+	"""Mirror bone transforms, rigify parameters, constraints and drivers from one side of the metarig to the other"""
+
+	bl_idname = "pose.rigify_symmetrize"
+	bl_label = "Symmetrize Metarig"
+	bl_options = {'REGISTER', 'UNDO'}
+
+	direction: bpy.props.EnumProperty(
+		name = "Direction"
+		,items = [
+			('LEFT_TO_RIGHT', "Left to Right", "Mirror bones on the +X side to the -X side")
+			,('RIGHT_TO_LEFT', "Right to Left", "Mirror bones on the -X side to the +X side")
+		]
+	)
+	only_selected: bpy.props.BoolProperty(name="Only Selected", description="Only mirror selected bones, instead of the whole metarig", default=False)
+	transforms: bpy.props.BoolProperty(name="Transforms", description="Mirror bone positions, parenting and B-Bone settings. Bones missing on the other side are created", default=True)
+	parameters: bpy.props.BoolProperty(name="Rigify Parameters", description="Mirror rigify type and parameters", default=True)
+	constraints: bpy.props.BoolProperty(name="Constraints", description="Mirror constraints, replacing existing ones on the other side", default=True)
+	drivers: bpy.props.BoolProperty(name="Drivers", description="Mirror drivers, replacing existing ones on the other side", default=True)
+
+	@classmethod
+	def poll(cls, context):
+		obj = context.object
+		return obj and obj.type=='ARMATURE' and obj.mode in ('POSE', 'EDIT', 'OBJECT')
+
+	def get_bone_pairs(self, rig):
+		""" Return a list of (source, target) bone names. Must be called in edit mode. """
+		edit_bones = rig.data.edit_bones
+		# Blender's +X is the character's left side.
+		sign = 1 if self.direction=='LEFT_TO_RIGHT' else -1
+		sources = {eb.name for eb in edit_bones if eb.select} if self.only_selected else None
+
+		pairs, missing = mirror_pairs([(eb.name, eb.head.x + eb.tail.x) for eb in edit_bones], sign, self.transforms, sources)
+		# Missing bones are only created for the pairs that are kept. They get their shape from mirror_transforms().
+		for name in missing:
+			edit_bones.new(name)
+		return pairs
+
+	def mirror_transforms(self, rig, pairs):
+		""" Mirror edit bone properties of all target bones at once. Must be called in edit mode. """
+		edit_bones = rig.data.edit_bones
+		index = {eb.name : i for i, eb in enumerate(edit_bones)}
+		src = np.array([index[s] for s, d in pairs], dtype=int)
+		dst = np.array([index[d] for s, d in pairs], dtype=int)
+		count = len(edit_bones)
+
+		for prop in MIRROR_VECTOR_PROPS:
+			values = np.empty(count*3, dtype=np.float32)
+			edit_bones.foreach_get(prop, values)
+			values = values.reshape(-1, 3)
+			values[dst] = values[src] * MIRROR_VECTOR_SIGN
+			edit_bones.foreach_set(prop, values.ravel())
+
+		for prop in existing_edit_bone_props(MIRROR_FLOAT_PROPS.keys()):
+			values = np.empty(count, dtype=np.float32)
+			edit_bones.foreach_get(prop, values)
+			values[dst] = values[src] * MIRROR_FLOAT_PROPS[prop]
+			edit_bones.foreach_set(prop, values)
+
+		# Parenting can't be done in bulk.
+		copy_props = existing_edit_bone_props(COPY_PROPS)
+		for s, d in pairs:
+			src_bone = edit_bones[s]
+			dst_bone = edit_bones[d]
+			parent = src_bone.parent
+			if parent:
+				parent = edit_bones.get(cloud_utils.flip_name(parent.name)) or parent
+			dst_bone.parent = parent
+			for prop in copy_props:
+				setattr(dst_bone, prop, getattr(src_bone, prop))
+
+	def mirror_constraints(self, rig, pairs):
+		for s, d in pairs:
+			src_bone = rig.pose.bones[s]
+			dst_bone = rig.pose.bones[d]
+			for c in dst_bone.constraints[:]:
+				dst_bone.constraints.remove(c)
+
+			for c in src_bone.constraints:
+				new_c = dst_bone.constraints.new(c.type)
+				copy_attributes(c, new_c, skip=['name', 'type', 'targets'])
+				new_c.name = flip_constraint_name(c.name)
+				if hasattr(c, 'subtarget'):
+					new_c.subtarget = cloud_utils.flip_name(c.subtarget)
+				if hasattr(c, 'pole_subtarget'):
+					new_c.pole_subtarget = cloud_utils.flip_name(c.pole_subtarget)
+				if c.type == 'ARMATURE':
+					for t in c.targets:
+						new_t = new_c.targets.new()
+						new_t.target = t.target
+						new_t.subtarget = cloud_utils.flip_name(t.subtarget)
+						new_t.weight = t.weight
+
+	def mirror_drivers(self, rig, pairs):
+		sources = {s for s, d in pairs}
+		targets = {d for s, d in pairs}
+
+		for id_data in (rig, rig.data):
+			if not id_data.animation_data: continue
+			to_remove = []
+			to_copy = []
+			for fc in id_data.animation_data.drivers:
+				name = cloud_utils.bone_name_from_data_path(fc.data_path)
+				if name in targets:
+					to_remove.append((fc.data_path, fc.array_index))
+				elif name in sources:
+					to_copy.append((Driver(fc), fc.data_path, fc.array_index))
+
+			for data_path, index in to_remove:
+				id_data.driver_remove(data_path, index)
+
+			for driver, data_path, index in to_copy:
+				for var in driver.variables:
+					for t in var.targets:
+						t.bone_target = cloud_utils.flip_name(t.bone_target)
+						t.data_path = flip_data_path(t.data_path)
+				driver.make_real(id_data, flip_data_path(data_path), index)
+
+	def execute(self, context):
+		rig = context.object
+		org_mode = rig.mode
+
+		bpy.ops.object.mode_set(mode='EDIT')
+		pairs = self.get_bone_pairs(rig)
+		if pairs and self.transforms:
+			self.mirror_transforms(rig, pairs)
+		bpy.ops.object.mode_set(mode='POSE')
+
+		if self.parameters:
+			for s, d in pairs:
+				copy_rigify_params(rig.pose.bones[s], rig.pose.bones[d], flip_strings=True)
+		if self.constraints:
+			self.mirror_constraints(rig, pairs)
+		if self.drivers:
+			self.mirror_drivers(rig, pairs)
+
+		bpy.ops.object.mode_set(mode=org_mode)
+		self.report({'INFO'}, f"Symmetrized {len(pairs)} bones.")
+		return { 'FINISHED' }
+
 def register():
 	from bpy.utils import register_class
 	register_class(MirrorRigifyParameters)
 	register_class(CopyRigifyParameters)
+	register_class(SymmetrizeMetarig)
 
 def unregister():
 	from bpy.utils import unregister_class
 	unregister_class(MirrorRigifyParameters)
-	unregister_class(CopyRigifyParameters)
\ No newline at end of file
+	unregister_class(CopyRigifyParameters)
+	unregister_class(SymmetrizeMetarig)
\ No newline at end of file
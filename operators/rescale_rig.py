@@ -0,0 +1,204 @@
+import bpy, ast, io, tokenize
+import numpy as np
+from bpy.props import FloatProperty, BoolProperty
+from mathutils import Matrix
+
+from ..rigs.cloud_utils import EnsureVisible
+
+# Edit bone properties that are lengths, so they scale along with the rig.
+LENGTH_VECTOR_PROPS = ('head', 'tail')
+LENGTH_FLOAT_PROPS = ('bbone_x', 'bbone_z', 'envelope_distance', 'head_radius', 'tail_radius')
+
+def scale_edit_bones(armature, factor):
+	""" Scale the edit bones of an armature around its origin, all at once. Must be called in edit mode. """
+	edit_bones = armature.edit_bones
+	count = len(edit_bones)
+
+	for prop in LENGTH_VECTOR_PROPS:
+		values = np.empty(count*3, dtype=np.float32)
+		edit_bones.foreach_get(prop, values)
+		edit_bones.foreach_set(prop, values * factor)
+
+	for prop in LENGTH_FLOAT_PROPS:
+		values = np.empty(count, dtype=np.float32)
+		edit_bones.foreach_get(prop, values)
+		edit_bones.foreach_set(prop, values * factor)
+
+def scale_shapes(rig, factor):
+	""" Scale bone shapes that were scaled by the rig scale during generation, see CloudBaseRig.configure_bones(). """
+	pose_bones = rig.pose.bones
+	count = len(pose_bones)
+
+	scales = np.empty(count, dtype=np.float32)
+	pose_bones.foreach_get('custom_shape_scale', scales)
+	use_bone_size = np.empty(count, dtype=bool)
+	pose_bones.foreach_get('use_custom_shape_bone_size', use_bone_size)
+	pose_bones.foreach_set('custom_shape_scale', np.where(use_bone_size, scales, scales * factor))
+
+def uses_names(node, names):
+	return any(isinstance(n, ast.Name) and n.id in names for n in ast.walk(node))
+
+def is_number(node):
+	if type(node).__name__ == 'Num':	# Before Python 3.8.
+		return True
+	return isinstance(node, ast.Constant) and type(node.value) in (int, float)
+
+def scale_distance_constants(expression, distance_vars, factor):
+	""" Scale the numbers that are compared against distance variables in a driver expression,
+	eg. the chain length in "ik * stretch * (distance > 0.52 * scale)".
+	"""
+	try:
+		tree = ast.parse(expression, mode='eval')
+	except SyntaxError:
+		return expression
+
+	offsets = set()
+	for node in ast.walk(tree):
+		if not isinstance(node, ast.Compare): continue
+		sides = [node.left] + node.comparators
+		if not any(uses_names(side, distance_vars) for side in sides): continue
+		for side in sides:
+			if uses_names(side, distance_vars): continue
+			offsets.update(n.col_offset for n in ast.walk(side) if is_number(n))
+
+	if not offsets:
+		return expression
+
+	# The syntax tree only knows where numbers start, the tokens also know where they end.
+	parts = []
+	last = 0
+	for token in tokenize.generate_tokens(io.StringIO(expression).readline):
+		if token.type == tokenize.NUMBER and token.start[1] in offsets:
+			parts.append(expression[last:token.start[1]])
+			# Not rounded, since the generator doesn't round the chain length either, see CloudIKChainRig.
+			parts.append(repr(float(token.string) * factor))
+			last = token.end[1]
+	parts.append(expression[last:])
+	return "".join(parts)
+
+def scale_drivers(rig, factor):
+	for id_data in (rig, rig.data):
+		if not id_data.animation_data: continue
+		for fc in id_data.animation_data.drivers:
+			driver = fc.driver
+			if driver.type != 'SCRIPTED': continue
+			distance_vars = {v.name for v in driver.variables if v.type == 'LOC_DIFF'}
+			if not distance_vars: continue
+			expression = scale_distance_constants(driver.expression, distance_vars, factor)
+			if expression != driver.expression:
+				driver.expression = expression
+
+def scale_constraints(rig, factor):
+	for pb in rig.pose.bones:
+		for c in pb.constraints:
+			if c.type == 'STRETCH_TO':
+				c.rest_length *= factor
+			elif c.type == 'CHILD_OF':
+				matrix = c.inverse_matrix.copy()
+				matrix.translation *= factor
+				c.inverse_matrix = matrix
+
+def find_rig_curves(rig):
+	""" Find the curve objects that are hooked to the rig or used by its Spline IK constraints. """
+	curves = {o for o in bpy.data.objects if o.type=='CURVE' and any(m.type=='HOOK' and m.object==rig for m in o.modifiers)}
+	for pb in rig.pose.bones:
+		for c in pb.constraints:
+			if c.type=='SPLINE_IK' and c.target and c.target.type=='CURVE':
+				curves.add(c.target)
+	return curves
+
+def scale_curves(rig, curves, factor):
+	""" Scale the curve points around the rig's origin, the same way the bones were scaled.
+	Like CloudSplineIKRig.fill_curve(), this treats the curve's local space as relative to the rig's space. """
+	done = set()
+	for curve_ob in curves:
+		if curve_ob.data in done: continue
+		done.add(curve_ob.data)
+		# Matrix that scales curve-local coordinates around the rig's origin.
+		to_rig = curve_ob.matrix_basis
+		scale = to_rig.inverted() @ Matrix.Scale(factor, 4) @ to_rig
+		for spline in curve_ob.data.splines:
+			for cp in spline.bezier_points:
+				cp.co = scale @ cp.co
+				cp.handle_left = scale @ cp.handle_left
+				cp.handle_right = scale @ cp.handle_right
+			for p in spline.points:
+				co = scale @ p.co.to_3d()
+				p.co = (*co, p.co.w)
+		for m in curve_ob.modifiers:
+			if m.type=='HOOK' and m.object==rig:
+				m.center = scale @ m.center
+
+def reset_hooks(rig, curves):
+	""" Recalculate the inverse matrix of the rig's hooks after its bones were scaled, the same way as CloudCurveRig.add_hook(). """
+	for curve_ob in curves:
+		for m in curve_ob.modifiers:
+			if m.type!='HOOK' or m.object!=rig: continue
+			bone = rig.data.bones.get(m.subtarget)
+			if not bone: continue
+			m.matrix_inverse = (rig.matrix_world @ bone.matrix_local).inverted() @ curve_ob.matrix_world
+
+def find_metarig(rig):
+	for o in bpy.data.objects:
+		if o.type == 'ARMATURE' and o.data.rigify_target_rig == rig:
+			return o
+
+class RescaleGeneratedRig(bpy.types.Operator):
+	"""Rescale a generated rig in place, the same way regenerating it from a scaled metarig would"""
+
+	bl_idname = "object.cloudrig_rescale"
+	bl_label = "Rescale Generated Rig"
+	bl_options = {'REGISTER', 'UNDO'}
+
+	factor: FloatProperty(name="Factor", description="Scale factor relative to the rig's current size", default=1.0, min=0.001)
+	rescale_metarig: BoolProperty(name="Rescale Metarig", description="Also rescale the metarig that this rig was generated from, so that regenerating keeps the new size", default=True)
+
+	@classmethod
+	def poll(cls, context):
+		obj = context.object
+		return obj and obj.type=='ARMATURE' and 'cloudrig' in obj.data
+
+	def invoke(self, context, event):
+		return context.window_manager.invoke_props_dialog(self)
+
+	def rescale_bones(self, context, obj):
+		visible = EnsureVisible(obj)
+		context.view_layer.objects.active = obj
+		bpy.ops.object.mode_set(mode='EDIT')
+		scale_edit_bones(obj.data, self.factor)
+		bpy.ops.object.mode_set(mode='OBJECT')
+		visible.restore()
+
+	def execute(self, context):
+		rig = context.object
+		org_mode = rig.mode
+		if self.factor == 1:
+			return { 'FINISHED' }
+
+		bpy.ops.object.mode_set(mode='OBJECT')
+		self.rescale_bones(context, rig)
+		scale_shapes(rig, self.factor)
+		scale_constraints(rig, self.factor)
+		scale_drivers(rig, self.factor)
+		curves = find_rig_curves(rig)
+		scale_curves(rig, curves, self.factor)
+		reset_hooks(rig, curves)
+
+		if self.rescale_metarig:
+			metarig = find_metarig(rig)
+			if metarig:
+				self.rescale_bones(context, metarig)
+			else:
+				self.report({'WARNING'}, "Could not find the metarig of this rig, only the rig was rescaled.")
+
+		context.view_layer.objects.active = rig
+		bpy.ops.object.mode_set(mode=org_mode)
+		return { 'FINISHED' }
+
+def register():
+	from bpy.utils import register_class
+	register_class(RescaleGeneratedRig)
+
+def unregister():
+	from bpy.utils import unregister_class
+	unregister_class(RescaleGeneratedRig)
@@ -0,0 +1,83 @@
+import numpy as np
+from mathutils import Vector
+
+class ChainGeometry:
+	""" Precomputed geometry of a chain of bones, for placing many things along it at once.
+	chain: A list of anything with head and tail vectors, eg. BoneInfos or EditBones.
+	"""
+
+	def __init__(self, chain):
+		assert len(chain) > 0, "Error: Can't compute the geometry of an empty bone chain."
+		self.heads = np.array([b.head[:] for b in chain], dtype=float)
+		self.tails = np.array([b.tail[:] for b in chain], dtype=float)
+		self.vecs = self.tails - self.heads
+		self.lengths = np.linalg.norm(self.vecs, axis=1)
+
+		# Zero length bones get a zero direction, like Vector.normalized() would give.
+		safe_lengths = np.where(self.lengths > 0, self.lengths, 1.0)
+		self.directions = self.vecs / safe_lengths[:, None]
+
+		# Where each bone ends and starts, measured along the chain.
+		self.ends = np.cumsum(self.lengths)
+		self.starts = self.ends - self.lengths
+
+	@property
+	def total_length(self):
+		return float(self.ends[-1])
+
+	def points_at_lengths(self, lengths):
+		""" Find the points at the given lengths down the chain.
+		Lengths past the end of the chain continue in the direction of the last bone.
+		Return their positions and directions as two (N, 3) arrays.
+		"""
+		lengths = np.asarray(lengths, dtype=float)
+		# Index of the first bone that ends past each length.
+		indices = np.searchsorted(self.ends, lengths, side='right')
+		indices = np.minimum(indices, len(self.ends)-1)
+
+		directions = self.directions[indices]
+		remaining = lengths - self.starts[indices]
+		locs = self.heads[indices] + directions * remaining[:, None]
+		return locs, directions
+
+	def points_at_indices(self, indices):
+		""" Instead of using bone lengths, find the heads of the bones at the given indices.
+		The direction is averaged with the previous bone's, and indices past the end of the chain give the last tail.
+		Return their positions and directions as two (N, 3) arrays.
+		"""
+		indices = np.asarray(indices, dtype=int)
+		past_end = indices >= len(self.heads)
+		clamped = np.minimum(indices, len(self.heads)-1)
+
+		locs = np.where(past_end[:, None], self.tails[clamped], self.heads[clamped])
+
+		averaged = (clamped > 0) & ~past_end
+		vecs = self.vecs[clamped] + np.where(averaged[:, None], self.vecs[clamped-1], 0.0)
+		norms = np.linalg.norm(vecs, axis=1)
+		directions = vecs / np.where(norms > 0, norms, 1.0)[:, None]
+		return locs, directions
+
+	def subdivide(self, segments):
+		""" Cut each bone of the chain into equal segments.
+		segments: Number of segments, either one for all bones or a list with one for each bone.
+		Return the heads and tails of all segments in chain order as two (N, 3) arrays.
+		"""
+		segments = np.broadcast_to(np.asarray(segments, dtype=int), (len(self.heads),))
+		bone_indices = np.repeat(np.arange(len(self.heads)), segments)
+
+		# Index of each segment within its own bone.
+		first_segments = np.cumsum(segments) - segments
+		segment_indices = np.arange(len(bone_indices)) - np.repeat(first_segments, segments)
+
+		counts = segments[bone_indices]
+		heads = self.heads[bone_indices]
+		vecs = self.vecs[bone_indices]
+		return (
+			heads + vecs * (segment_indices / counts)[:, None]
+			,heads + vecs * ((segment_indices+1) / counts)[:, None]
+		)
+
+	@staticmethod
+	def to_vectors(array):
+		""" Convert an (N, 3) array to a list of mathutils Vectors. """
+		return [Vector(row) for row in array.tolist()]
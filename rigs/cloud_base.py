@@ -30,6 +30,9 @@ class CloudBaseRig(BaseRig, CloudUtilities):
 	
 	default_layers = lambda name: DefaultLayers[name].value
 
+	# Whether the right side version of this rig can be planned by mirroring the left side one, when the generator's Symmetric Generation option is enabled. See cloud_symmetry.py.
+	symmetry_mirrorable = False
+
 	def find_org_bones(self, bone):
 		"""Populate self.bones.org."""
 		from rigify.utils.bones import BoneDict
@@ -39,6 +42,14 @@ class CloudBaseRig(BaseRig, CloudUtilities):
 			main=[bone.name] + connected_children_names(self.obj, bone.name),
 		)
 
+	@classmethod
+	def validate_metarig(cls, validator, pose_bone):
+		""" Check the metarig for errors that would make this rig fail, before anything is generated.
+		validator: MetarigValidator that collects the errors, see cloud_validation.py.
+		pose_bone: The metarig bone that this rig type is assigned to.
+		"""
+		pass
+
 	def initialize(self):
 		super().initialize()
 		"""Gather and validate data about the rig."""
@@ -51,6 +62,10 @@ class CloudBaseRig(BaseRig, CloudUtilities):
 		
 		self.meta_base_bone = self.generator.metarig.pose.bones.get(self.base_bone.replace("ORG-", ""))
 		self.parent_candidates = {}
+		# Left side rig that this rig's bones will be mirrored from, instead of running prepare_bones. Set by the generator.
+		self.mirror_source = None
+		# Arguments of add_ui_data() calls, so they can be repeated for a mirrored rig.
+		self.ui_data_log = []
 		self.ensure_bone_groups()
 
 		# Determine rig scale by armature height.
@@ -134,6 +149,7 @@ class CloudBaseRig(BaseRig, CloudUtilities):
 				name = group_name,
 				preset = set_info['preset']
 			)
+			# Each bone set gets its own list, BoneInfoContainer.bone() relies on this to tell which bone set a bone was created in.
 			self.bone_layers[ui_name] = group_layers[:]
 
 			# Handle layer overrides for DEF/MCH/ORG from generator parameters.
@@ -147,6 +163,23 @@ class CloudBaseRig(BaseRig, CloudUtilities):
 			if set_info['override'] == 'ORG' and cloudrig.override_org_layers:
 				self.bone_layers[ui_name] = cloudrig.org_layers[:]
 
+	def rigify_invoke_stage(self, stage):
+		if stage == 'prepare_bones' and self.mirror_source:
+			# This rig's bones are mirrored from the left side after this stage.
+			return
+		super().rigify_invoke_stage(stage)
+
+	def mirror_from_rig(self, source_rig):
+		""" Called after this rig's bones were mirrored from source_rig instead of running prepare_bones.
+		Do what prepare_bones would have done outside of the BoneInfos, and re-calculate anything that doesn't simply mirror. """
+		for org_bi in self.org_chain:
+			eb = self.get_bone(org_bi.name)
+			eb.use_connect = False
+			# Take the exact ORG bone transforms rather than the mirrored ones.
+			org_bi.head = eb.head.copy()
+			org_bi.tail = eb.tail.copy()
+			org_bi.roll = eb.roll
+
 	def prepare_bones(self):
 		self.load_org_bones()
 
@@ -1,6 +1,7 @@
 import bpy
 from bpy.props import BoolProperty, StringProperty, EnumProperty
 from rigify.base_rig import BaseRig, stage
+from rigify.base_generate import GeneratorPlugin
 from rigify.utils.bones import BoneDict
 from ..definitions.bone import BoneInfoContainer, BoneInfo
 from ..definitions.driver import Driver
@@ -34,6 +35,9 @@ class CloudBoneRig(BaseRig):
 			if c.type in ('CHILD_OF', 'ARMATURE'):
 				self.do_parenting = False
 
+		# The configure, apply and finalize stages of all cloud_bones are run together by the batch, after all other rigs.
+		CloudBoneBatch(self.generator).register_rig(self)
+
 	def generate_bones(self):
 		org_bone = self.get_bone(self.bones.org)
 		meta_bone = self.generator.metarig.pose.bones.get(self.orgless_name)
@@ -54,8 +58,7 @@ class CloudBoneRig(BaseRig):
 			def_bone.bbone_x = def_bone.bbone_z = org_bone.bbone_x
 			cloud_utils.set_layers(def_bone, [DefaultLayers['DEF'].value])
 
-	@stage.configure_bones
-	def modify_bone_group(self):
+	def modify_bone_group(self, batch):
 		mod_bone = self.get_bone(self.bone_name)
 		if self.copy_type == 'Tweak':
 			# Since the ORG- bone got deleted during generate_bones, rename it to that name, to move any references from that ORG- bone over to the real bone.
@@ -67,39 +70,28 @@ class CloudBoneRig(BaseRig):
 		meta_bg = meta_bone.bone_group
 		if self.copy_type=='Create' or self.params.CR_bone_group:
 			if meta_bg:
-				bg_name = meta_bg.name
-				bg = self.obj.pose.bone_groups.get(bg_name)
-				if not bg:
-					bg = self.obj.pose.bone_groups.new(name=bg_name)
-					bg.color_set = meta_bg.color_set
-					bg.colors.normal = meta_bg.colors.normal[:]
-					bg.colors.active = meta_bg.colors.active[:]
-					bg.colors.select = meta_bg.colors.select[:]
-				mod_bone.bone_group = bg
-
-	@stage.apply_bones
-	def modify_edit_bone(self):
+				mod_bone.bone_group = batch.ensure_bone_group(meta_bg)
+
+	def modify_edit_bone(self, edit_bones):
+		""" edit_bones: Dictionary of the generated rig's edit bones by name, shared by all cloud_bone rigs. """
 		meta_bone = self.generator.metarig.data.bones.get(self.orgless_name)
 
-		mod_bone = self.get_bone(self.bone_name)
-		pose_bone = self.obj.pose.bones.get(mod_bone.name)
+		mod_bone = edit_bones[self.bone_name]
 
 		if hasattr(self, "def_bone_name"):
 			# TODO: Would this fail if I put it in generate_bones stage? I feel like that's where it started, and it would fail, but I don't really get why.
-			def_bone = self.get_bone(self.def_bone_name)
+			def_bone = edit_bones[self.def_bone_name]
 			def_bone.parent = mod_bone
 
 		parent_name = self.params.CR_custom_bone_parent
-		parent_bone = None
 		if parent_name != "" and self.do_parenting:
-			try:
-				parent_bone = self.get_bone(parent_name)
-				if parent_bone.bbone_segments == 1:
-					mod_bone.parent = parent_bone
-				else:
-					mod_bone.parent = None # For parenting to bendy bones, we add Armature constraint in modify_pose_bone().
-			except:
+			parent_bone = edit_bones.get(parent_name)
+			if not parent_bone:
 				print(f"Warning: Target parent bone {parent_name} not found for rig {self.base_bone}")
+			elif parent_bone.bbone_segments == 1:
+				mod_bone.parent = parent_bone
+			else:
+				mod_bone.parent = None # For parenting to bendy bones, we add Armature constraint in modify_pose_bone().
 
 		if self.params.CR_bone_transforms:
 			mod_bone.head = meta_bone.head_local.copy()
@@ -109,7 +101,9 @@ class CloudBoneRig(BaseRig):
 			mod_bone.bbone_z = meta_bone.bbone_z
 		
 		# Rename the bone to its final name, without the ORG- prefix.
+		del edit_bones[mod_bone.name]
 		self.bone_name = mod_bone.name = self.orgless_name
+		edit_bones[mod_bone.name] = mod_bone
 
 	def do_parenting_with_constraint(self):
 		mod_bone = self.get_bone(self.bone_name)
@@ -123,8 +117,10 @@ class CloudBoneRig(BaseRig):
 			arm_con.targets.new()
 			cloud_utils.move_constraint(self.obj, arm_con, bone=mod_bone, target_index=0)
 
-	@stage.finalize
-	def modify_pose_bone(self):	
+	def modify_pose_bone(self, batch):
+		""" Apply the pose bone settings of this element. Constraint relinking is left to the batch, which does it for all elements at once.
+		Returns the pose bone whose constraints need relinking.
+		"""
 		meta_bone = self.generator.metarig.pose.bones.get(self.orgless_name)
 		mod_bone = self.get_bone(self.bone_name)
 
@@ -134,9 +130,7 @@ class CloudBoneRig(BaseRig):
 
 		if self.copy_type == 'Create':
 			self.do_parenting_with_constraint()
-			for c in mod_bone.constraints:
-				self.relink_constraint(c)
-			return
+			return mod_bone
 
 		mod_bone.bone.use_deform = meta_bone.bone.use_deform
 
@@ -189,48 +183,19 @@ class CloudBoneRig(BaseRig):
 		self.do_parenting_with_constraint()
 		# Copy constraints from meta_bone to mod_bone
 		for c in meta_bone.constraints:
-			new_con = self.copy_constraint(c, mod_bone)
+			batch.copy_constraint(c, mod_bone)
 
-		# Relink constraints
-		for c in mod_bone.constraints:
-			self.relink_constraint(c)
-		
 		# Copy custom properties
 		if self.params.CR_custom_props and '_RNA_UI' in meta_bone.keys():
 			keys = [k for k in meta_bone.keys() if k not in ['_RNA_UI', 'rigify_parameters', 'rigify_type']]
 			custom_props.copy_custom_properties(meta_bone, keys, mod_bone)
 
-		# Copy and retarget drivers
-		self.copy_and_retarget_drivers(mod_bone)
+		# Drivers are copied by the batch after relinking, since their data paths use the relinked constraint names.
+		return mod_bone
 
 	###############################
 	# Utilities
 
-	def copy_constraint(self, from_con, to_bone):
-		new_con = to_bone.constraints.new(from_con.type)
-		new_con.name = from_con.name
-
-		skip = ['active', 'bl_rna', 'error_location', 'error_rotation', 'is_proxy_local', 'is_valid', 'rna_type', 'type']
-		for key in dir(from_con):
-			if "__" in key: continue
-			if(key in skip): continue
-
-			if key=='targets' and new_con.type=='ARMATURE':
-				for t in from_con.targets:
-					new_t = new_con.targets.new()
-					new_t.target = t.target
-					new_t.subtarget = t.subtarget
-				continue
-
-			value = getattr(from_con, key)
-			try:
-				setattr(new_con, key, value)
-			except AttributeError:	# Read-Only properties throw AttributeError. These should all be added to the skip list.
-				print(f"Warning: Can't copy read-only attribute {key} to {new_con.type} type constraint")
-				continue
-		
-		return new_con
-
 	def relink_constraint(self, constraint):
 		""" Constraint re-linking is done similarly to Rigify, but without the prefix-only shorthand.
 			Constraint names can contain an @ character which separates the constraint name from the desired target to set when all bones have been generated.
@@ -275,18 +240,9 @@ class CloudBoneRig(BaseRig):
 
 	def copy_and_retarget_drivers(self, bone):
 		"""Copy and retarget drivers from both the metarig Object and the metarig Data."""
-		metarig = self.generator.metarig
-		rig = self.obj
-		if not metarig.animation_data: return
-
-		for d in metarig.animation_data.drivers:
-			if bone.name in d.data_path:
-				self.copy_and_relink_driver(d, rig, d.data_path, d.array_index)
-		
-		if not metarig.data.animation_data: return
-		for d in metarig.data.animation_data.drivers:
-			if bone.name in d.data_path:
-				self.copy_and_relink_driver(d, rig.data, d.data_path, d.array_index)
+		for d, is_data in self.generator.get_metarig_drivers(bone.name):
+			owner = self.obj.data if is_data else self.obj
+			self.copy_and_relink_driver(d, owner, d.data_path, d.array_index)
 
 	##############################
 	# Parameters
@@ -401,6 +357,84 @@ class CloudBoneRig(BaseRig):
 		else:
 			col1.prop(params, "CR_create_deform_bone")
 
+class CloudBoneBatch(GeneratorPlugin):
+	""" Generator plugin that processes all cloud_bone rig elements together.
+	Bone groups, edit bones and constraint attribute lists are looked up once and shared by all elements,
+	and constraints are relinked in a single pass once every element has been applied, followed by copying drivers.
+	"""
+
+	def __init__(self, generator):
+		super().__init__(generator)
+		self.rigs = []
+		self.bone_groups = {}			# Bone group name : Bone group on the generated rig
+		self.constraint_attributes = {}	# Constraint type : Names of writable properties
+
+	def register_rig(self, rig):
+		self.rigs.append(rig)
+
+	def ensure_bone_group(self, meta_bg):
+		"""Return the bone group on the generated rig that corresponds to a metarig bone group, creating it if needed."""
+		bg = self.bone_groups.get(meta_bg.name)
+		if bg: return bg
+
+		bg = self.obj.pose.bone_groups.get(meta_bg.name)
+		if not bg:
+			bg = self.obj.pose.bone_groups.new(name=meta_bg.name)
+			bg.color_set = meta_bg.color_set
+			bg.colors.normal = meta_bg.colors.normal[:]
+			bg.colors.active = meta_bg.colors.active[:]
+			bg.colors.select = meta_bg.colors.select[:]
+		self.bone_groups[meta_bg.name] = bg
+		return bg
+
+	def get_constraint_attributes(self, con):
+		"""Return the names of the properties to copy for a given constraint type."""
+		attributes = self.constraint_attributes.get(con.type)
+		if attributes is None:
+			skip = ['active', 'error_location', 'error_rotation', 'is_proxy_local', 'is_valid', 'rna_type', 'type', 'targets']
+			attributes = [p.identifier for p in con.bl_rna.properties if not p.is_readonly and p.identifier not in skip]
+			self.constraint_attributes[con.type] = attributes
+		return attributes
+
+	def copy_constraint(self, from_con, to_bone):
+		new_con = to_bone.constraints.new(from_con.type)
+		new_con.name = from_con.name
+
+		if new_con.type=='ARMATURE':
+			for t in from_con.targets:
+				new_t = new_con.targets.new()
+				new_t.target = t.target
+				new_t.subtarget = t.subtarget
+
+		for key in self.get_constraint_attributes(from_con):
+			try:
+				setattr(new_con, key, getattr(from_con, key))
+			except AttributeError:
+				print(f"Warning: Can't copy read-only attribute {key} to {new_con.type} type constraint")
+		
+		return new_con
+
+	def configure_bones(self):
+		for rig in self.rigs:
+			rig.modify_bone_group(self)
+
+	def apply_bones(self):
+		edit_bones = {eb.name : eb for eb in self.obj.data.edit_bones}
+		for rig in self.rigs:
+			rig.modify_edit_bone(edit_bones)
+
+	def finalize(self):
+		relink = [(rig, rig.modify_pose_bone(self)) for rig in self.rigs]
+
+		for rig, pose_bone in relink:
+			for c in pose_bone.constraints:
+				rig.relink_constraint(c)
+
+		# Copy and retarget drivers.
+		for rig, pose_bone in relink:
+			if rig.copy_type != 'Create':
+				rig.copy_and_retarget_drivers(pose_bone)
+
 class Rig(CloudBoneRig):
 	pass
 
@@ -6,6 +6,7 @@ from rigify.base_rig import stage
 
 from ..definitions.driver import Driver
 from .cloud_utils import make_name, slice_name
+from .chain_geometry import ChainGeometry
 from .cloud_base import CloudBaseRig
 
 class CloudChainRig(CloudBaseRig):
@@ -13,6 +14,8 @@ class CloudChainRig(CloudBaseRig):
 
 	description = "Stretchy chain for pure squash and stretch."
 
+	symmetry_mirrorable = True
+
 	def initialize(self):
 		super().initialize()
 		"""Gather and validate data about the rig."""
@@ -98,8 +101,8 @@ class CloudChainRig(CloudBaseRig):
 		if self.params.CR_cap_control:
 			# Add final STR control.
 			last_def = def_sections[-1][-1]
-			sliced = slice_name(last_def.name)
-			str_name = make_name(["STR", "TIP"], sliced[1], sliced[2])
+			sliced = self.slice_name(last_def.name)
+			str_name = self.make_name(["STR", "TIP"], sliced[1], sliced[2])
 
 			str_bone = self.make_str_bone(last_def, self.org_chain[-1], str_name)
 			str_bone.head = last_def.tail
@@ -179,6 +182,12 @@ class CloudChainRig(CloudBaseRig):
 		self.str_bones = []
 		self.def_bones = []
 
+		chain_segments = [self.get_segments(org_i, self.org_chain) for org_i in range(len(self.org_chain))]
+		heads, tails = ChainGeometry(self.org_chain).subdivide([s[0] for s in chain_segments])
+		heads = ChainGeometry.to_vectors(heads)
+		tails = ChainGeometry.to_vectors(tails)
+		def_i = 0
+
 		def_sections = []
 		for org_i, org_bone in enumerate(self.org_chain):
 			org_name = org_bone.name
@@ -186,22 +195,20 @@ class CloudChainRig(CloudBaseRig):
 			def_section = []
 
 			# Last bone shouldn't get segmented.
-			segments, bbone_segments = self.get_segments(org_i, self.org_chain)
+			segments, bbone_segments = chain_segments[org_i]
 			
 			for i in range(0, segments):
 				## Create Deform bones
 				def_name = org_name.replace("ORG", "DEF")
-				sliced = slice_name(def_name)
+				sliced = self.slice_name(def_name)
 				number = str(i+1) if segments > 1 else ""
-				def_name = make_name(sliced[0], sliced[1] + number, sliced[2])
-
-				unit = org_bone.vec / segments
+				def_name = self.make_name(sliced[0], sliced[1] + number, sliced[2])
 
 				def_bone = self.bone_infos.bone(
 					name					 = def_name
 					,source					 = org_bone
-					,head					 = org_bone.head + (unit * i)
-					,tail					 = org_bone.head + (unit * (i+1))
+					,head					 = heads[def_i]
+					,tail					 = tails[def_i]
 					,roll					 = org_bone.roll
 					,bone_group				 = self.bone_groups["Deform Bones"]
 					,layers					 = self.bone_layers["Deform Bones"]
@@ -215,6 +222,7 @@ class CloudChainRig(CloudBaseRig):
 					def_bone.inherit_scale = 'NONE'
 				org_bone.def_bones.append(def_bone)
 				self.def_bones.append(def_bone)
+				def_i += 1
 			
 				if self.params.CR_sharp_sections:
 					# First bone of the segment, but not the first bone of the chain.
@@ -3,6 +3,7 @@ from bpy.props import BoolProperty, IntProperty, FloatProperty, StringProperty
 from mathutils import Vector, Matrix
 
 from rigify.base_rig import stage
+from rigify.base_generate import GeneratorPlugin
 
 from ..definitions.driver import Driver
 from .cloud_base import CloudBaseRig
@@ -13,15 +14,28 @@ class CloudCurveRig(CloudBaseRig):
 
 	description = "Create hook controls for an existing bezier curve."
 
+	@classmethod
+	def validate_metarig(cls, validator, pose_bone):
+		super().validate_metarig(validator, pose_bone)
+		cls.validate_curve_rig(validator, pose_bone)
+
+	@classmethod
+	def validate_curve_rig(cls, validator, pose_bone):
+		params = pose_bone.rigify_parameters
+		curve_ob = cls.datablock_from_str(bpy.data.objects, params.CR_target_curve_name)
+		if not validator.check(curve_ob, f"Curve object {params.CR_target_curve_name} not found for curve rig: {pose_bone.name}"): return
+		if not validator.check(curve_ob.type=='CURVE', f"Curve target {params.CR_target_curve_name} is not a curve for rig: {pose_bone.name}"): return
+		validator.check(len(curve_ob.data.splines) > 0, f"Curve object {curve_ob.name} has no splines, for curve rig: {pose_bone.name}")
+
 	def initialize(self):
 		"""Gather and validate data about the rig."""
 		super().initialize()
 		self.initialize_curve_rig()
+		# Hook setup for all curve rigs is done together by this generator plugin.
+		self.hook_batch = CurveHookBatch(self.generator)
 	
 	def initialize_curve_rig(self):
 		curve_ob = self.get_curve()
-		assert curve_ob, f"Error: Curve object {self.params.CR_target_curve_name} not found for curve rig: {self.base_bone}"
-		assert curve_ob.type=='CURVE', f"Error: Curve target {self.params.CR_target_curve_name} is not a curve for rig: {self.base_bone}"
 		self.num_controls = len(curve_ob.data.splines[0].bezier_points)
 
 	def create_root(self):
@@ -160,133 +174,72 @@ class CloudCurveRig(CloudBaseRig):
 		self.create_root()
 		self.create_curve_point_hooks()
 
-	def add_hook(self, cp_i, boneinfo, main_handle=False, left_handle=False, right_handle=False):				
-		""" Create a Hook modifier on the curve(active object, in edit mode), hooking the control point at a given index to a given bone. The bone must exist. """
-		if not boneinfo: return
-		bpy.ops.curve.select_all(action='DESELECT')
-
-		# Workaround of T74888, can be removed once D7190 is in master. (Preferably wait until it's in a release build)
-		curve_ob = self.get_curve()
-		spline = curve_ob.data.splines[0]
-		points = spline.bezier_points
-		cp = points[cp_i]
-		
-		cp.select_control_point = main_handle
-		cp.select_left_handle = left_handle
-		cp.select_right_handle = right_handle
-
-		# Set active bone
+	def add_hook(self, curve_ob, cp_i, boneinfo, main_handle=False, left_handle=False, right_handle=False):
+		""" Create a Hook modifier at the bottom of the curve's modifier stack, hooking the control point at a given index to a given bone. The bone must exist. 
+		The modifier is created directly, so this doesn't depend on selection, the active object or the object's mode.
+		CurveHookBatch.create_hooks() takes care of removing old hooks and of the order of the modifiers."""
+		# A bezier point is made up of three vertices: left handle, control point, right handle.
+		cp = curve_ob.data.splines[0].bezier_points[cp_i]
+		hooked = [
+			(left_handle,  cp_i*3,   cp.handle_left),
+			(main_handle,  cp_i*3+1, cp.co),
+			(right_handle, cp_i*3+2, cp.handle_right)
+		]
+		indices = [index for use, index, co in hooked if use]
+		center = Vector()
+		for use, index, co in hooked:
+			if use:
+				center += co / len(indices)
+
+		mod = curve_ob.modifiers.new(name=boneinfo.name, type='HOOK')
+		mod.show_expanded = False
+		mod.object = self.obj
+		mod.subtarget = boneinfo.name
+		mod.vertex_indices_set(indices)
+		mod.center = center
+
+		# Inverse matrix that cancels out the bone's rest pose, so the curve isn't deformed in rest pose.
+		# The modifier evaluates relative to the curve's world matrix, so parents and constraints on the curve are accounted for.
 		bone = self.obj.data.bones.get(boneinfo.name)
-		self.obj.data.bones.active = bone
-
-		# If the hook modifier already exists, remove it.
-		mod = curve_ob.modifiers.get(boneinfo.name)
-		if mod:
-			curve_ob.modifiers.remove(mod)
-
-		# Add hook
-		old_modifiers = [m.name for m in curve_ob.modifiers]
-		bpy.ops.object.hook_add_selob(use_bone=True)
-
-		# Find and rename the newly added modifier.
-		for m in curve_ob.modifiers:
-			if m.name not in old_modifiers:
-				m.name = boneinfo.name
-				m.show_expanded = False
-				
-				# Move modifier to top of the stack...
-				# (Curve object must be active)
-				for i in range(len(curve_ob.modifiers)):
-					bpy.ops.object.modifier_move_up(modifier=m.name)
-
-				break
+		mod.matrix_inverse = (self.obj.matrix_world @ bone.matrix_local).inverted() @ curve_ob.matrix_world
 
 	def get_curve(self):
 		return self.datablock_from_str(bpy.data.objects, self.params.CR_target_curve_name)
 
-	def setup_curve(self, hooks, curve_name):
-		""" Configure the Hook Modifiers for the curve. This requires switching object modes. 
+	def setup_curve(self, hooks, curve):
+		""" Queue the Hook Modifiers and radius drivers of a curve. These are created by CurveHookBatch for all curve rigs together, after every rig's configure_bones().
 		hooks: List of BoneInfo objects that were created with create_hooks().
-		curve_ob: The curve object.
+		curve: The curve object, or its name.
 		Only single-spline curve is supported. That one spline must have the same number of control points as the number of hooks."""
 
-		curve_ob = self.get_curve()
-		assert curve_ob, f"Error: Curve object {curve_name} doesn't exist for rig: {self.base_bone}"
-		curve_visible = self.ensure_visible(curve_ob)
-		bpy.ops.object.select_all(action='DESELECT')
-		self.obj.select_set(True)
-		bpy.context.view_layer.objects.active = self.obj
-		curve_ob.select_set(True)
-		bpy.context.view_layer.objects.active = curve_ob
-
-		assert curve_ob.visible_get(), "Error: Curve object could not be made visible. Perhaps it has a driver on its hide_viewport property that forces it to True?"
-
-		bpy.ops.object.mode_set(mode='EDIT')
-		bpy.ops.curve.select_all(action='DESELECT')
-		spline = curve_ob.data.splines[0]
-		points = spline.bezier_points
-		num_points = len(points)
+		curve_ob = curve
+		if type(curve) == str:
+			curve_ob = self.datablock_from_str(bpy.data.objects, curve)
+		assert curve_ob, f"Error: Curve object {curve} doesn't exist for rig: {self.base_bone}"
 
+		num_points = len(curve_ob.data.splines[0].bezier_points)
 		assert num_points == len(hooks), f"Error: Curve object {curve_ob.name} has {num_points} points, but {len(hooks)} hooks were passed."
 
-		# Disable all modifiers on the curve object
-		mod_vis_backup = {}
-		for m in curve_ob.modifiers:
-			mod_vis_backup[m.name] = m.show_viewport
-			m.show_viewport = False
-
-		# Disable all constraints on the curve object
-		constraint_vis_backup = {}
-		for c in curve_ob.constraints:
-			constraint_vis_backup[c.name] = c.mute
-			c.mute=True
-		
-		bpy.context.view_layer.update()
+		self.hook_batch.add_curve(curve_ob, self, hooks)
 
-		for i in range(0, num_points):
-			hook_b = hooks[i]
+	def hook_curve(self, hooks):
+		""" Plan the Hook Modifiers of a curve for each of its points.
+		Return a list of add_hook() arguments after the curve object, and a dictionary of point index : name of the bone that should drive that point's radius."""
+		hook_args = []
+		radius_bones = {}
+		for i, hook_b in enumerate(hooks):
 			if not self.params.CR_controls_for_handles:
-				self.add_hook(i, hook_b, main_handle=True, left_handle=True, right_handle=True)
+				hook_args.append((i, hook_b, True, True, True))
 			else:
-				self.add_hook(i, hook_b, main_handle=True)
-				self.add_hook(i, hook_b.left_handle_control, left_handle=True)
-				self.add_hook(i, hook_b.right_handle_control, right_handle=True)
+				hook_args.append((i, hook_b, True, False, False))
+				hook_args.append((i, hook_b.left_handle_control, False, True, False))
+				hook_args.append((i, hook_b.right_handle_control, False, False, True))
 
-			# Add radius driver
-			data_path = f"splines[0].bezier_points[{i}].radius"
-			curve_ob.data.driver_remove(data_path)
-			
-			D = curve_ob.data.driver_add(data_path)
-			driver = D.driver
-
-			driver.expression = "var"
-			my_var = driver.variables.new()
-			my_var.name = "var"
-			my_var.type = 'TRANSFORMS'
-			
-			var_tgt = my_var.targets[0]
-			var_tgt.id = self.obj
-			var_tgt.transform_space = 'WORLD_SPACE'
-			var_tgt.transform_type = 'SCALE_X'
-			var_tgt.bone_target = hooks[i].name
-			
+			radius_bones[i] = hook_b.name
 			if self.params.CR_separate_radius:
-				var_tgt.bone_target = hooks[i].radius_control.name
-
-		# Restore modifier visibility on curve object
-		for m in curve_ob.modifiers:
-			if m.name in mod_vis_backup:
-				m.show_viewport = mod_vis_backup[m.name]
+				radius_bones[i] = hook_b.radius_control.name
 		
-		# Restore constraints visibility on the curve object
-		for c in curve_ob.constraints:
-			c.mute = constraint_vis_backup[c.name]
-
-		# Reset selection so Rigify can continue execution.
-		bpy.ops.object.mode_set(mode='OBJECT')
-		curve_visible.restore()
-		bpy.context.view_layer.objects.active = self.obj
-		self.obj.select_set(True)
+		return [args for args in hook_args if args[1]], radius_bones
 
 	def configure_bones(self):
 		self.setup_curve(self.hooks, self.params.CR_target_curve_name)
@@ -373,5 +326,89 @@ class CloudCurveRig(CloudBaseRig):
 		
 		return ui_rows
 
+class CurveHookBatch(GeneratorPlugin):
+	""" Generator plugin that sets up the hooks of every curve targeted by curve rigs.
+	Curve rigs queue their work with setup_curve(), and it is done here once per curve object, after all rigs' configure_bones().
+	Since the hooks are created through the data API and in their final order, this doesn't need operators, or to touch selection, visibility or object modes.
+	"""
+
+	def __init__(self, generator):
+		super().__init__(generator)
+		self.curves = {}	# Curve object name : (Curve object, [(rig, hooks)])
+
+	def add_curve(self, curve_ob, rig, hooks):
+		self.curves.setdefault(curve_ob.name, (curve_ob, []))[1].append((rig, hooks))
+
+	def configure_bones(self):
+		for curve_ob, jobs in self.curves.values():
+			hooks = []
+			radius_bones = {}
+			for rig, hook_bones in jobs:
+				hook_args, rig_radius_bones = rig.hook_curve(hook_bones)
+				hooks.extend((rig, args) for args in hook_args)
+				radius_bones.update(rig_radius_bones)
+			self.create_hooks(curve_ob, hooks)
+			self.set_radius_drivers(curve_ob, radius_bones)
+
+	def create_hooks(self, curve_ob, hooks):
+		""" Create the Hook Modifiers of a curve above its other modifiers, replacing hooks of the same name.
+		hooks: List of (rig, add_hook() arguments after the curve object).
+		Modifiers can't be moved without operators, so the other modifiers are removed, and added again below the hooks with the same settings.
+		"""
+		hook_names = {args[1].name for rig, args in hooks}
+		others = [self.get_modifier_values(m) for m in curve_ob.modifiers if m.name not in hook_names]
+		for m in curve_ob.modifiers[:]:
+			curve_ob.modifiers.remove(m)
+
+		# Hooks used to be moved to the top of the stack one by one as they were added, so the last hook comes first.
+		for rig, args in reversed(hooks):
+			rig.add_hook(curve_ob, *args)
+
+		for name, mod_type, values, vertex_indices in others:
+			mod = curve_ob.modifiers.new(name=name, type=mod_type)
+			for key, value in values.items():
+				setattr(mod, key, value)
+			if vertex_indices:
+				mod.vertex_indices_set(vertex_indices)
+
+	def get_modifier_values(self, mod):
+		""" Return what's needed to create a copy of a modifier: (name, type, writable property values, hooked vertex indices). """
+		skip = ['name', 'type', 'rna_type']
+		values = {p.identifier : getattr(mod, p.identifier) for p in mod.bl_rna.properties if not p.is_readonly and p.identifier not in skip}
+		for key, value in values.items():
+			if hasattr(value, '__len__') and not isinstance(value, str):
+				values[key] = value.copy() if hasattr(value, 'copy') else value[:]
+		vertex_indices = mod.vertex_indices[:] if mod.type == 'HOOK' else []
+		return (mod.name, mod.type, values, vertex_indices)
+
+	def set_radius_drivers(self, curve_ob, radius_bones):
+		""" Drive the radius of curve points by the X scale of bones.
+		radius_bones: Dictionary of point index : bone name.
+		Existing radius drivers are found in a single pass and re-used."""
+		curve = curve_ob.data
+		existing = {}
+		if curve.animation_data:
+			existing = {fc.data_path : fc for fc in curve.animation_data.drivers}
+
+		for i, bone_name in radius_bones.items():
+			data_path = f"splines[0].bezier_points[{i}].radius"
+			fc = existing.get(data_path) or curve.driver_add(data_path)
+			driver = fc.driver
+			# A re-used driver may have had its type changed by hand.
+			driver.type = 'SCRIPTED'
+			for var in list(driver.variables):
+				driver.variables.remove(var)
+
+			driver.expression = "var"
+			my_var = driver.variables.new()
+			my_var.name = "var"
+			my_var.type = 'TRANSFORMS'
+			
+			var_tgt = my_var.targets[0]
+			var_tgt.id = self.obj
+			var_tgt.transform_space = 'WORLD_SPACE'
+			var_tgt.transform_type = 'SCALE_X'
+			var_tgt.bone_target = bone_name
+
 class Rig(CloudCurveRig):
 	pass
\ No newline at end of file
@@ -18,12 +18,17 @@ class CloudIKChainRig(CloudFKChainRig):
 
 	description = "IK chain with stretchy IK and IK/FK snapping. Pole control optional."
 
+	@classmethod
+	def validate_metarig(cls, validator, pose_bone):
+		super().validate_metarig(validator, pose_bone)
+		params = pose_bone.rigify_parameters
+		chain = validator.chain(pose_bone)
+		validator.check(params.CR_ik_length <= len(chain), f"IK Length parameter ({params.CR_ik_length}) higher than number of bones in the connected chain ({len(chain)}) on rig: {pose_bone.name}")
+
 	def initialize(self):
 		"""Gather and validate data about the rig."""
 		super().initialize()
 
-		assert self.params.CR_ik_length <= len(self.bones.org.main), f"IK Length parameter ({self.params.CR_ik_length}) higher than number of bones in the connected chain ({len(self.bones.org.main)}) on rig: {self.meta_base_bone.name}"
-
 		# UI Strings and Custom Property names
 		self.category = self.slice_name(self.base_bone)[1]
 		if self.params.CR_use_custom_category_name:
@@ -416,6 +421,15 @@ class CloudIKChainRig(CloudFKChainRig):
 			data_path = f'constraints["{ik_ct_name}"].influence'
 			org_bone.drivers[data_path] = drv
 
+	def mirror_from_rig(self, source_rig):
+		super().mirror_from_rig(source_rig)
+		# The pole angle depends on which way the bone axes point, so it has to be calculated for this side.
+		self.calculate_ik_info()
+		for bone in self.bone_infos.bones:
+			for contype, props in bone.constraints:
+				if contype == 'IK' and 'pole_angle' in props:
+					props['pole_angle'] = self.pole_angle
+
 	def prepare_bones(self):
 		super().prepare_bones()
 		self.prepare_root_bone()
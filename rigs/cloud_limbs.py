@@ -14,6 +14,18 @@ class Rig(CloudIKChainRig):
 
 	description = "IK chain with extras for specific limbs, such as foot roll."
 
+	@classmethod
+	def validate_metarig(cls, validator, pose_bone):
+		super().validate_metarig(validator, pose_bone)
+		params = pose_bone.rigify_parameters
+		chain = validator.chain(pose_bone)
+		if params.CR_limb_type=='ARM':
+			validator.check(len(chain) == 3, f"Arm chain must be exactly 3 connected bones, on rig: {pose_bone.name}")
+		if params.CR_limb_type=='LEG':
+			if validator.check(len(chain) == 4, f"Leg chain must be exactly 4 connected bones, on rig: {pose_bone.name}") and params.CR_use_foot_roll:
+				heel_pivot_name = params.CR_heel_pivot_bone or chain[-2]
+				validator.check(heel_pivot_name in validator.metarig.data.bones, f"Could not find HeelPivot bone in the metarig: {heel_pivot_name}, for rig: {pose_bone.name}")
+
 	def initialize(self):
 		super().initialize()
 		"""Gather and validate data about the rig."""
@@ -21,12 +33,7 @@ class Rig(CloudIKChainRig):
 		self.params.CR_sharp_sections = True
 		self.meta_base_bone.rigify_parameters.CR_sharp_sections = True
 
-		# Safety checks
 		self.limb_type = self.params.CR_limb_type
-		if self.limb_type=='ARM':
-			assert len(self.bones.org.main) == 3, "Arm chain must be exactly 3 connected bones."
-		if self.limb_type=='LEG':
-			assert len(self.bones.org.main) == 4, "Leg chain must be exactly 4 connected bones."
 
 		# UI Strings and Custom Property names
 		self.category = "arms" if self.limb_type == 'ARM' else "legs"
@@ -231,7 +238,6 @@ class Rig(CloudIKChainRig):
 		if heel_pivot_name=="":
 			heel_pivot_name = self.org_chain[-2].name.replace("ORG-", "")
 		heel_pivot_bone = self.generator.metarig.data.bones.get(heel_pivot_name)
-		assert heel_pivot_bone, f"ERROR: Could not find HeelPivot bone in the metarig: {heel_pivot_name}."
 
 		# Take the bone shape size of the foot controls from the heel pivot bone bbone scale.
 		self.ik_mstr._bbone_x = heel_pivot_bone.bbone_x
@@ -20,19 +20,27 @@ class CloudSpineRig(CloudChainRig):
 
 	description = "Spine setup with FK and IK-like controls. Stretchy IK settings can be found in the rig UI."
 
+	# The spine runs down the middle, and its extra prepare stages aren't covered by mirroring.
+	symmetry_mirrorable = False
+
 	def find_org_bones(self, bone):
 		"""Populate self.bones.org."""
 		return BoneDict(
 			main=[bone.name] + connected_children_names(self.obj, bone.name),
 		)
 
+	@classmethod
+	def validate_metarig(cls, validator, pose_bone):
+		super().validate_metarig(validator, pose_bone)
+		params = pose_bone.rigify_parameters
+		chain = validator.chain(pose_bone)
+		validator.check(len(chain) >= params.CR_spine_length, f"Spine Length parameter value({params.CR_spine_length}) cannot exceed length of bone chain connected to {pose_bone.name} ({len(chain)})")
+		validator.check(len(chain) > 2, f"Spine must consist of at least 3 connected bones, on rig: {pose_bone.name}")
+
 	def initialize(self):
 		"""Gather and validate data about the rig."""
 		super().initialize()
 
-		assert len(self.bones.org.main) >= self.params.CR_spine_length, f"Spine Length parameter value({self.params.CR_spine_length}) cannot exceed length of bone chain connected to {self.base_bone} ({len(self.bones.org.main)})"
-		assert len(self.bones.org.main) > 2, "Spine must consist of at least 3 connected bones."
-
 		self.ik_prop_name = "ik_spine"
 		self.ik_stretch_name = "ik_stretch_spine"
 
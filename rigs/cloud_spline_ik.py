@@ -1,105 +1,193 @@
 import bpy
 from bpy.props import BoolProperty, IntProperty, FloatProperty, StringProperty
 from mathutils import Vector
+import numpy as np
 
 from rigify.base_rig import stage
 
 from ..definitions.driver import Driver
 from .cloud_curve import CloudCurveRig
 from .cloud_utils import make_name, slice_name
+from .chain_geometry import ChainGeometry
+from .spline_segments import split_segments, segment_bones, segment_report
 
 class CloudSplineIKRig(CloudCurveRig):
 	"""CloudRig Spline IK chain."""
 
 	description = "Create a bezier curve object to drive a bone chain with Spline IK constraint, controlled by Hooks."
 
+	@classmethod
+	def validate_curve_rig(cls, validator, pose_bone):
+		# The curve is created by the rig, so unlike the base curve rig, it doesn't have to exist.
+		params = pose_bone.rigify_parameters
+		length = len(validator.chain(pose_bone))
+		subdiv = params.CR_subdivide_deform
+		total = length * subdiv
+
+		if params.CR_segmented_spline_ik:
+			max_bones = params.CR_segment_max_bones
+			validator.check(params.CR_match_hooks_to_bones, f"Spline IK rig on {pose_bone.name}: Segmented Spline IK requires Match Controls to Bones, so that each segment can start and end at a hook control.")
+			validator.check(subdiv <= max_bones, f"Spline IK rig on {pose_bone.name}: Each bone is subdivided {subdiv} times, which doesn't fit in segments of {max_bones} bones.")
+		else:
+			validator.check(total <= 255, f"Spline IK rig on {pose_bone.name}: Trying to subdivide each bone {subdiv} times, in a bone chain of {length}, would result in {total} bones. The Spline IK constraint only supports a chain of 255 bones. You should lower the subdivision level, or enable Segmented Spline IK")
+
 	def initialize_curve_rig(self):
 		length = len(self.bones.org.main)
 		subdiv = self.params.CR_subdivide_deform
-		total = length * subdiv
-		assert total <= 255, f"Error: Spline IK rig on {self.base_bone}: Trying to subdivide each bone {subdiv} times, in a bone chain of {length}, would result in {total} bones. The Spline IK constraint only supports a chain of 255 bones. You should lower the subdivision level"
+
+		# Ranges of ORG bone indices, each of which gets its own Spline IK constraint.
+		self.segments = [(0, length)]
+		if self.params.CR_segmented_spline_ik:
+			self.segments = split_segments(length, subdiv, self.params.CR_segment_max_bones)
 
 		self.num_controls = len(self.bones.org.main)+1 if self.params.CR_match_hooks_to_bones else self.params.CR_num_hooks
 
 	def create_curve(self):
-		""" Find or create the Bezier Curve that will be used by the rig. """
+		""" Find or create the Bezier Curve that will be used by the rig. 
+		If the curve exists but its number of points doesn't match the number of hook controls, its spline is rebuilt in place, so references to the curve object stay intact.
+		The curve is built through the data API, so this doesn't depend on the active object, mode or 3D cursor. """
 		
 		curve_ob = self.datablock_from_str(bpy.data.objects, self.params.CR_target_curve_name)
 		if curve_ob:
-			len_curve_points = len(curve_ob.data.splines[0].bezier_points)
-			if len_curve_points != self.num_controls:
-				print(f"WARNING: CURVE CONTROL POINTS ({len_curve_points}) DON'T MATCH NUMBER OF DESIRED HOOK CONTROLS ({self.num_controls}) ON RIG: {self.base_bone}")
 			self.curve_ob_name = curve_ob.name
-			return curve_ob
-			# There is no good way in the python API to delete curve points, so deleting the entire curve is necessary to allow us to generate with fewer controls than a previous generation.
-			bpy.data.objects.remove(curve_ob)	# What's not so cool about this is that if anything in the scene was referencing this curve, that reference gets broken.
+			len_curve_points = len(curve_ob.data.splines[0].bezier_points) if len(curve_ob.data.splines) > 0 else 0
+			if len_curve_points == self.num_controls:
+				return curve_ob
+			print(f"WARNING: Curve {curve_ob.name} has {len_curve_points} control points, but rig {self.base_bone} needs {self.num_controls}. Rebuilding the curve.")
+			self.clear_curve(curve_ob)
+		else:
+			curve_name = "CUR-" + self.generator.metarig.name.replace("META-", "")
+			curve_name += "_" + (self.params.CR_hook_name if self.params.CR_hook_name!="" else self.base_bone.replace("ORG-", ""))
 
-		
-		sum_bone_length = sum([b.length for b in self.org_chain])
-		length_unit = sum_bone_length / (self.num_controls-1)
-		handle_length = length_unit / self.params.CR_curve_handle_ratio
-		
-		curve_name = "CUR-" + self.generator.metarig.name.replace("META-", "")
-		curve_name += "_" + (self.params.CR_hook_name if self.params.CR_hook_name!="" else self.base_bone.replace("ORG-", ""))
-		
-		# Create and name curve object.
-		org_mode = bpy.context.object.mode
-		bpy.ops.curve.primitive_bezier_curve_add(radius=0.2, location=(0, 0, 0))
+			curve_ob = self.new_curve_object(curve_name)
+			self.meta_base_bone.rigify_parameters.CR_target_curve_name = self.params.CR_target_curve_name = self.curve_ob_name = curve_ob.name
 
-		curve_ob = bpy.context.view_layer.objects.active
-		curve_ob.name = curve_name
-		self.meta_base_bone.rigify_parameters.CR_target_curve_name = self.params.CR_target_curve_name = self.curve_ob_name = curve_name
+			self.lock_transforms(curve_ob)
 
-		self.lock_transforms(curve_ob)
+		self.fill_curve(curve_ob)
+		return curve_ob
 
-		# Place the first and last bezier points to the first and last bone.
-		spline = curve_ob.data.splines[0]
-		points = spline.bezier_points
+	def new_curve_object(self, name):
+		""" Create an empty 3D curve object in the metarig's collection. """
+		curve_data = bpy.data.curves.new(name, type='CURVE')
+		curve_data.dimensions = '3D'
+		curve_ob = bpy.data.objects.new(name, curve_data)
+		self.generator.collection.objects.link(curve_ob)
+		return curve_ob
 
-		# Add the necessary number of curve points
-		points.add( self.num_controls-len(points) )
-		num_points = len(points)
-
-		# Configure control points...
-		for i in range(0, num_points):
-			curve_ob = bpy.data.objects.get(curve_name)
-			point_along_chain = i * length_unit
-			spline = curve_ob.data.splines[0]
-			points = spline.bezier_points
-			p = points[i]
-
-			# Place control points
-			index = i if self.params.CR_match_hooks_to_bones else -1
-			loc, direction = self.vector_along_bone_chain(self.org_chain, point_along_chain, index)
-			p.co = loc
-			p.handle_right = loc + handle_length * direction
-			p.handle_left  = loc - handle_length * direction
+	def new_spline(self, curve_ob, num_points):
+		""" Add a bezier spline with a given number of points to a curve. """
+		spline = curve_ob.data.splines.new('BEZIER')
+		points = spline.bezier_points
+		# A new spline starts with one point, and points added to it have Aligned handles. Make the first one match.
+		points[0].handle_left_type = points[0].handle_right_type = 'ALIGNED'
+		points.add(num_points - len(points))
+		return points
+
+	def clear_curve(self, curve_ob):
+		""" Remove the splines of a curve, along with the hooks and radius drivers that were set up for them by a previous generation. """
+		curve = curve_ob.data
+		curve.splines.clear()
+
+		for m in [m for m in curve_ob.modifiers if m.type=='HOOK' and m.object==self.obj]:
+			curve_ob.modifiers.remove(m)
 		
-		# Reset selection so Rigify can continue execution.
-		bpy.context.view_layer.objects.active = self.obj
-		self.obj.select_set(True)
-		bpy.ops.object.mode_set(mode=org_mode)
+		if curve.animation_data:
+			for fc in [fc for fc in curve.animation_data.drivers if fc.data_path.startswith("splines[")]:
+				curve.animation_data.drivers.remove(fc)
+
+	def fill_curve(self, curve_ob):
+		""" Create a bezier spline on an empty curve, with a control point for each hook control, placed along the bone chain. """
+		geometry = ChainGeometry(self.org_chain)
+		length_unit = geometry.total_length / (self.num_controls-1)
+		handle_length = length_unit / self.params.CR_curve_handle_ratio
 
-		return curve_ob
+		if self.params.CR_match_hooks_to_bones:
+			locs, directions = geometry.points_at_indices(np.arange(self.num_controls))
+		else:
+			locs, directions = geometry.points_at_lengths(np.arange(self.num_controls) * length_unit)
+
+		# Bone positions are in the rig's space, the curve points are in the curve's local space.
+		to_local = np.array(curve_ob.matrix_basis.inverted())
+		def local(points):
+			return (points @ to_local[:3, :3].T + to_local[:3, 3]).astype(np.float32).ravel()
+
+		coords = local(locs)
+		handles_left = local(locs - directions * handle_length)
+		handles_right = local(locs + directions * handle_length)
+
+		points = self.new_spline(curve_ob, self.num_controls)
+		points.foreach_set('co', coords)
+		points.foreach_set('handle_left', handles_left)
+		points.foreach_set('handle_right', handles_right)
+
+	def segment_curve_name(self, i):
+		return f"{self.curve_ob_name}_Segment_{str(i).zfill(2)}"
+
+	def create_segment_curves(self):
+		""" For Segmented Spline IK, create a curve for each segment, made of the main curve's points within that segment.
+		Neighbouring segment curves share their end point, and all of them get hooked to the same controls as the main curve. """
+		self.segment_curve_names = []
+		if not self.params.CR_segmented_spline_ik:
+			self.remove_segment_curves(0)
+			return
+
+		main_curve = bpy.data.objects.get(self.curve_ob_name)
+		main_points = main_curve.data.splines[0].bezier_points
+		coords = {}
+		for attr in ('co', 'handle_left', 'handle_right'):
+			coords[attr] = [0.0] * (len(main_points) * 3)
+			main_points.foreach_get(attr, coords[attr])
+
+		for i, (first, last) in enumerate(self.segments):
+			name = self.segment_curve_name(i)
+			curve_ob = bpy.data.objects.get(name)
+			if curve_ob:
+				self.clear_curve(curve_ob)
+			else:
+				curve_ob = self.new_curve_object(name)
+			curve_ob.matrix_basis = main_curve.matrix_basis.copy()
+			self.lock_transforms(curve_ob)
+
+			# There is a curve point at the head of each ORG bone and at the tail of the last one,
+			# so a segment of ORG bones [first, last) uses the points from first to last, inclusive.
+			points = self.new_spline(curve_ob, last - first + 1)
+			for attr, values in coords.items():
+				points.foreach_set(attr, values[first*3 : (last+1)*3])
+
+			self.segment_curve_names.append(curve_ob.name)
+
+		self.remove_segment_curves(len(self.segments))
+
+	def remove_segment_curves(self, first):
+		""" Remove segment curves left over from a previous generation that had more segments, or was segmented. """
+		i = first
+		leftover = bpy.data.objects.get(self.segment_curve_name(i))
+		while leftover:
+			bpy.data.objects.remove(leftover)
+			i += 1
+			leftover = bpy.data.objects.get(self.segment_curve_name(i))
 
 	def create_def_chain(self):
 		self.def_bones = []
 		segments = self.params.CR_subdivide_deform
 
+		heads, tails = ChainGeometry(self.org_chain).subdivide(segments)
+		heads = ChainGeometry.to_vectors(heads)
+		tails = ChainGeometry.to_vectors(tails)
+
 		count_def_bone = 0
 		for org_bone in self.org_chain:
 			for i in range(0, segments):
 				## Create Deform bones
 				def_name = self.params.CR_hook_name if self.params.CR_hook_name!="" else self.base_bone.replace("ORG-", "")
 				def_name = "DEF-" + def_name + "_" + str(count_def_bone).zfill(3)
-				count_def_bone += 1
 
-				unit = org_bone.vec / segments
 				def_bone = self.bone_infos.bone(
 					name		 = def_name
 					,source		 = org_bone
-					,head		 = org_bone.head + (unit * i)
-					,tail		 = org_bone.head + (unit * (i+1))
+					,head		 = heads[count_def_bone]
+					,tail		 = tails[count_def_bone]
 					,roll		 = org_bone.roll
 					,bbone_width = 0.03
 					,bone_group	 = self.bone_groups["Curve Deform Bones"]
@@ -107,6 +195,7 @@ class CloudSplineIKRig(CloudCurveRig):
 					,hide_select = self.mch_disable_select
 					,use_deform	 = True
 				)
+				count_def_bone += 1
 
 				if len(self.def_bones) > 0:
 					def_bone.parent = self.def_bones[-1]
@@ -115,10 +204,24 @@ class CloudSplineIKRig(CloudCurveRig):
 				
 				self.def_bones.append(def_bone)
 
+	def find_curves(self):
+		""" Find the curves made by the last generation, without changing them. """
+		curve_ob = self.get_curve()
+		assert curve_ob, f"Error: Curve of Spline IK rig {self.base_bone} not found. Generate the rig before re-fitting it."
+		self.curve_ob_name = curve_ob.name
+		self.segment_curve_names = []
+		if self.params.CR_segmented_spline_ik:
+			self.segment_curve_names = [self.segment_curve_name(i) for i in range(len(self.segments))]
+
 	def prepare_bones(self):
 		super().prepare_bones()
 		self.create_root()
-		self.create_curve()
+		if self.generator.refitting:
+			# Rebuilding the curves would remove their hooks and radius drivers, which refit doesn't re-create.
+			self.find_curves()
+		else:
+			self.create_curve()
+			self.create_segment_curves()
 		self.create_curve_point_hooks()
 		self.create_def_chain()
 	
@@ -128,13 +231,23 @@ class CloudSplineIKRig(CloudCurveRig):
 		pass
 
 	def configure_bones(self):
-		# Add constraint to deform chain
-		self.def_bones[-1].add_constraint(self.obj, 'SPLINE_IK', 
-			use_curve_radius = True,
-			chain_count		 = len(self.def_bones),
-			target			 = bpy.data.objects.get(self.curve_ob_name),
-			true_defaults	 = True
-		)
+		# Add a Spline IK constraint to each segment of the deform chain.
+		# Without segmentation, there is a single segment that uses the main curve.
+		segment_curves = self.segment_curve_names or [self.curve_ob_name]
+		bone_sets = segment_bones(self.def_bones, self.segments, self.params.CR_subdivide_deform)
+		for (first, last), def_bones, curve_name in zip(self.segments, bone_sets, segment_curves):
+			def_bones[-1].add_constraint(self.obj, 'SPLINE_IK', 
+				use_curve_radius = True,
+				chain_count		 = len(def_bones),
+				target			 = bpy.data.objects.get(curve_name),
+				true_defaults	 = True
+			)
+			if self.segment_curve_names:
+				self.setup_curve(self.hooks[first:last+1], curve_name)
+
+		report = segment_report(self.base_bone, [len(def_bones) for def_bones in bone_sets])
+		if report:
+			print(report)
 
 		super().configure_bones()
 
@@ -182,6 +295,18 @@ class CloudSplineIKRig(CloudCurveRig):
 			,min=1
 			,max=99
 		)
+		params.CR_segmented_spline_ik = BoolProperty(
+			 name		 = "Segmented Spline IK"
+			,description = "Split the deform chain into several Spline IK constraints, each on its own curve that covers part of the chain and is hooked to the same controls. Allows chains longer than the 255 bones that a single Spline IK constraint supports"
+			,default	 = False
+		)
+		params.CR_segment_max_bones = IntProperty(
+			 name		 = "Bones per Segment"
+			,description = "Maximum number of deform bones in each segment. Segments always start and end at an original bone"
+			,default	 = 255
+			,min		 = 1
+			,max		 = 255
+		)
 
 	@classmethod
 	def cloud_params_ui(cls, layout, params):
@@ -199,6 +324,10 @@ class CloudSplineIKRig(CloudCurveRig):
 		layout.prop(params, "CR_match_hooks_to_bones")	# TODO: When this is false, the directions of the curve points and bones don't match, and both of them are unsatisfactory. It would be nice if we would interpolate between the direction of the two bones, using length_remaining/bone.length as a factor, or something similar to that.
 		if not params.CR_match_hooks_to_bones:
 			layout.prop(params, "CR_num_hooks")
+		else:
+			layout.prop(params, "CR_segmented_spline_ik")
+			if params.CR_segmented_spline_ik:
+				layout.prop(params, "CR_segment_max_bones")
 		
 		return ui_rows
 
@@ -1,7 +1,10 @@
 import bpy
 import os
+from mathutils import Vector
 from ..definitions.driver import Driver
 from ..definitions.custom_props import CustomProp
+from .chain_geometry import ChainGeometry
+from .naming import flip_name
 
 class CloudUtilities:
 	# Utility functions that probably won't be overriden by a sub-class because they perform a very specific task.
@@ -17,6 +20,8 @@ class CloudUtilities:
 
 		assert ('prop_bone' in info) and ('prop_id' in info), 'Error: Expected an info dict with at least "prop_bone" and "prop_id" keys.'
 
+		self.ui_data_log.append((ui_area, row_name, col_name, info, default, _min, _max))
+
 		if ui_area not in self.obj.data:
 			self.obj.data[ui_area] = {}
 
@@ -43,13 +48,13 @@ class CloudUtilities:
 	):
 		# Initialize some defaults
 		if not hng_name:
-			sliced = slice_name(bone.name)
+			sliced = self.slice_name(bone.name)
 			sliced[0].insert(0, "HNG")
-			hng_name = make_name(*sliced)
+			hng_name = self.make_name(*sliced)
 		if not parent_bone:
 			parent_bone = bone.parent
 		if not limb_name:
-			limb_name = "Hinge: " + self.side_suffix + " " + slice_name(bone.name)[1]
+			limb_name = "Hinge: " + self.side_suffix + " " + self.slice_name(bone.name)[1]
 		
 		info = {
 			"prop_bone"			: prop_bone.name,
@@ -190,9 +195,9 @@ class CloudUtilities:
 
 	def create_parent_bone(self, child):
 		"""Copy a bone, prefix it with "P", make the bone shape a bit bigger and parent the bone to this copy."""
-		sliced = slice_name(child.name)
+		sliced = self.slice_name(child.name)
 		sliced[0].append("P")
-		parent_name = make_name(*sliced)
+		parent_name = self.make_name(*sliced)
 		parent_bone = self.bone_infos.bone(
 			name				= parent_name 
 			,source				= child
@@ -372,6 +377,26 @@ def slice_name(name, prefix_separator="-", suffix_separator="."):
 	base = name.split(prefix_separator)[-1].split(suffix_separator)[0]
 	return [prefixes, base, suffixes]
 
+def bone_name_from_data_path(data_path):
+	""" Return the bone name from a data path like 'pose.bones["Name"].location' or 'bones["Name"].bbone_x'.
+	Return None if the data path doesn't belong to a bone."""
+	for prefix in ('pose.bones["', 'bones["'):
+		if data_path.startswith(prefix):
+			break
+	else:
+		return None
+
+	start = end = len(prefix)
+	while True:
+		end = data_path.find('"', end)
+		if end == -1: return None
+		# A quote preceded by an odd number of backslashes is part of the name.
+		backslashes = len(data_path[start:end]) - len(data_path[start:end].rstrip("\\"))
+		if backslashes % 2 == 0: break
+		end += 1
+
+	return data_path[start:end].replace('\\"', '"').replace('\\\\', '\\')
+
 def lock_transforms(obj, loc=True, rot=True, scale=True):
 	if type(loc) in (list, tuple):
 		obj.lock_location = loc
@@ -392,38 +417,15 @@ def lock_transforms(obj, loc=True, rot=True, scale=True):
 		obj.lock_scale = [scale, scale, scale]
 
 def vector_along_bone_chain(chain, length=0, index=-1):
-	"""On a bone chain, find the point a given length down the chain. Return its position and direction."""
+	"""On a bone chain, find the point a given length down the chain. Return its position and direction.
+	If an index is given, instead simply return the location and direction of the bone at that index.
+	To find many points along the same chain, use ChainGeometry directly."""
+	geometry = ChainGeometry(chain)
 	if index > -1:
-		# Instead of using bone length, simply return the location and direction of a bone at a given index.
-		
-		# If the index is too high, return the tail of the bone.
-		if index >= len(chain):
-			b = chain[-1]
-			return (b.tail.copy(), b.vec.normalized())
-		
-		b = chain[index]
-		direction = b.vec.normalized()
-
-		if index > 0:
-			prev_bone = chain[index-1]
-			direction = (b.vec + prev_bone.vec).normalized()
-		return (b.head.copy(), direction)
-
-	
-	length_cumultative = 0
-	for b in chain:
-		if length_cumultative + b.length > length:
-			length_remaining = length - length_cumultative
-			direction = b.vec.normalized()
-			loc = b.head + direction * length_remaining
-			return (loc, direction)
-		else:
-			length_cumultative += b.length
-	
-	length_remaining = length - length_cumultative
-	direction = chain[-1].vec.normalized()
-	loc = chain[-1].tail + direction * length_remaining
-	return (loc, direction)
+		locs, directions = geometry.points_at_indices([index])
+	else:
+		locs, directions = geometry.points_at_lengths([length])
+	return (Vector(locs[0]), Vector(directions[0]))
 
 def set_layers(obj, layerlist, additive=False):
 	"""Layer setting function that can take either a list of booleans or a list of ints.
@@ -464,63 +466,6 @@ def set_active_collection(collection):
 	layer_collection = recursive_search_layer_collection(collection.name)
 	bpy.context.view_layer.active_layer_collection = layer_collection
 
-def flip_name(from_name, only=True, must_change=False):
-	# based on BLI_string_flip_side_name in https://developer.blender.org/diffusion/B/browse/master/source/blender/blenlib/intern/string_utils.c
-	# If only==True, only replace the first occurrence of a side identifier in the string, eg. "Left_Eyelid.L" would become "Right_Eyelid.L". With only==False, it would instead return "Right_Eyelid.R"
-	# if must_change==True, raise an error if the string couldn't be flipped.
-
-	l = len(from_name)	# Number of characters from left to right, that we still care about. At first we care about all of them.
-	
-	# Handling .### cases
-	if("." in from_name):
-		# Make sure there are only digits after the last period
-		after_last_period = from_name.split(".")[-1]
-		before_last_period = from_name.replace("."+after_last_period, "")
-		all_digits = True
-		for c in after_last_period:
-			if( c not in "0123456789" ):
-				all_digits = False
-				break
-		# If that is so, then we don't care about the characters after this last period.
-		if(all_digits):
-			l = len(before_last_period)
-	
-	new_name = from_name[:l]
-	
-	left = 				['left',  'Left',  'LEFT', 	'.l', 	  '.L', 		'_l', 				'_L',				'-l',	   '-L', 	'l.', 	   'L.',	'l_', 			 'L_', 			  'l-', 	'L-']
-	right_placehold = 	['*rgt*', '*Rgt*', '*RGT*', '*dotl*', '*dotL*', 	'*underscorel*', 	'*underscoreL*', 	'*dashl*', '*dashL', '*ldot*', '*Ldot', '*lunderscore*', '*Lunderscore*', '*ldash*','*Ldash*']
-	right = 			['right', 'Right', 'RIGHT', '.r', 	  '.R', 		'_r', 				'_R',				'-r',	   '-R', 	'r.', 	   'R.',	'r_', 			 'R_', 			  'r-', 	'R-']
-	
-	def flip_sides(list_from, list_to, new_name):
-		for side_idx, side in enumerate(list_from):
-			opp_side = list_to[side_idx]
-			if(only):
-				# Only look at prefix/suffix.
-				if(new_name.startswith(side)):
-					new_name = new_name[len(side):]+opp_side
-					break
-				elif(new_name.endswith(side)):
-					new_name = new_name[:-len(side)]+opp_side
-					break
-			else:
-				if("-" not in side and "_" not in side):	# When it comes to searching the middle of a string, sides must Strictly a full word or separated with . otherwise we would catch stuff like "_leg" and turn it into "_reg".
-					# Replace all occurences and continue checking for keywords.
-					new_name = new_name.replace(side, opp_side)
-					continue
-		return new_name
-	
-	new_name = flip_sides(left, right_placehold, new_name)
-	new_name = flip_sides(right, left, new_name)
-	new_name = flip_sides(right_placehold, right, new_name)
-	
-	# Re-add trailing digits (.###)
-	new_name = new_name + from_name[l:]
-
-	if(must_change):
-		assert new_name != from_name, "Failed to flip string: " + from_name
-	
-	return new_name
-
 def flat(vec):
 	""" Return a copy of a vector with its two absolute lowest values set to 0. Useful for making vectors world-aligned. """
 	new_vec = vec.copy()
@@ -541,40 +486,18 @@ def flat(vec):
 def move_constraint(obj, constraint, bone=None, target_index=-1):
 	"""Move a constraint in its stack to a target index. 0 for first, -1 for last.
 	bone: if specified, look for the constraint on this pose bone.
-	obj: object that has the constraint. If bone is specified, object should be the owner rig."""
-	my_context = bpy.context.copy()
-	my_context["constraint"] = constraint
-	
-	owner='OBJECT'
-	constraints = obj.constraints
-
-	org_active = None
-	if bone:
-		# assert obj.mode == 'POSE', "Error: Cannot move bone constraints while armature isn't in pose mode."
-		org_active = obj.data.bones.active
-		obj.data.bones.active = bone.bone
-		constraints = bone.constraints
-		owner='BONE'
-
-	cur_index = -1	# Current index of the constraint
-	for i, c in enumerate(constraints):
-		if c == constraint:
-			cur_index = i
-			break
+	obj: object that has the constraint. If bone is specified, object should be the owner rig.
+	This uses the constraint collection's move() function, so it costs a single call and doesn't need a UI context or an active bone."""
+	constraints = bone.constraints if bone else obj.constraints
+
+	cur_index = constraints.find(constraint.name)	# Current index of the constraint
 	assert cur_index > -1, f"Error: Failed to move constraint {constraint.name} because it was not found on {obj}, {bone}"
 
 	if target_index < 0:
 		target_index = len(constraints)+target_index
 
-	moves = cur_index - target_index
-	move_func = bpy.ops.constraint.move_up if cur_index > target_index else bpy.ops.constraint.move_down
-	
-	for i in range(moves):
-		move_func(my_context, constraint=constraint.name, owner=owner)
-
-	# Restore active bone
-	if bone and org_active:
-		obj.data.bones.active = org_active
+	if cur_index != target_index:
+		constraints.move(cur_index, target_index)
 
 class EnsureVisible:
 	""" Ensure an object is visible, then reset it to how it was before. """
@@ -0,0 +1,113 @@
+import re
+from functools import lru_cache
+
+# This module doesn't depend on bpy, so it can be tested on its own, see tests/test_naming.py.
+
+# Side identifiers for flip_name(), based on BLI_string_flip_side_name in https://developer.blender.org/diffusion/B/browse/master/source/blender/blenlib/intern/string_utils.c
+# Left sides are first swapped to placeholders, so that the right->left pass doesn't flip them back.
+SIDES_LEFT =		('left',  'Left',  'LEFT', 	'.l', 	  '.L', 		'_l', 				'_L',				'-l',	   '-L', 	'l.', 	   'L.',	'l_', 			 'L_', 			  'l-', 	'L-')
+SIDES_PLACEHOLDER =	('*rgt*', '*Rgt*', '*RGT*', '*dotl*', '*dotL*', 	'*underscorel*', 	'*underscoreL*', 	'*dashl*', '*dashL', '*ldot*', '*Ldot', '*lunderscore*', '*Lunderscore*', '*ldash*','*Ldash*')
+SIDES_RIGHT =		('right', 'Right', 'RIGHT', '.r', 	  '.R', 		'_r', 				'_R',				'-r',	   '-R', 	'r.', 	   'R.',	'r_', 			 'R_', 			  'r-', 	'R-')
+
+def _flip_pass(sides_from, sides_to):
+	""" Return the lookup tables of one flipping pass: (all sides, their (side, opposite side) pairs, the pairs used for replacing within the name). """
+	pairs = tuple(zip(sides_from, sides_to))
+	# When it comes to searching the middle of a string, sides must Strictly a full word or separated with . otherwise we would catch stuff like "_leg" and turn it into "_reg".
+	replace_pairs = tuple((side, opp_side) for side, opp_side in pairs if "-" not in side and "_" not in side)
+	return (sides_from, pairs, replace_pairs)
+
+FLIP_PASSES = (
+	_flip_pass(SIDES_LEFT, SIDES_PLACEHOLDER)
+	,_flip_pass(SIDES_RIGHT, SIDES_LEFT)
+	,_flip_pass(SIDES_PLACEHOLDER, SIDES_RIGHT)
+)
+
+def flip_name(from_name, only=True, must_change=False):
+	# If only==True, only replace the first occurrence of a side identifier in the string, eg. "Left_Eyelid.L" would become "Right_Eyelid.L". With only==False, it would instead return "Right_Eyelid.R"
+	# if must_change==True, raise an error if the string couldn't be flipped.
+	new_name = _flip_name(from_name, only)
+
+	if(must_change):
+		assert new_name != from_name, "Failed to flip string: " + from_name
+	
+	return new_name
+
+@lru_cache(maxsize=16384)
+def _flip_name(from_name, only):
+	l = len(from_name)	# Number of characters from left to right, that we still care about. At first we care about all of them.
+	
+	# Handling .### cases
+	if("." in from_name):
+		# If there are only digits after the last period, we don't care about the characters after it.
+		after_last_period = from_name.rsplit(".", 1)[1]
+		if after_last_period.strip("0123456789") == "":
+			l = len(from_name.replace("."+after_last_period, ""))
+	
+	new_name = from_name[:l]
+	
+	for sides, pairs, replace_pairs in FLIP_PASSES:
+		if(only):
+			# Only look at prefix/suffix.
+			if not (new_name.startswith(sides) or new_name.endswith(sides)):
+				continue
+			for side, opp_side in pairs:
+				if(new_name.startswith(side)):
+					new_name = new_name[len(side):]+opp_side
+					break
+				elif(new_name.endswith(side)):
+					new_name = new_name[:-len(side)]+opp_side
+					break
+		else:
+			# Replace all occurences.
+			for side, opp_side in replace_pairs:
+				if side in new_name:
+					new_name = new_name.replace(side, opp_side)
+	
+	# Re-add trailing digits (.###)
+	return new_name + from_name[l:]
+
+def flip_constraint_name(name):
+	""" Constraint names can have several @ separated subtargets, see CloudBoneRig.relink_constraint(). Flip each part. """
+	return "@".join([flip_name(part) for part in name.split("@")])
+
+def _flip_quoted_name(match):
+	""" Flip a ["quoted"] name matched in a data path. Quotes and backslashes in the name are escaped with a backslash. """
+	name = re.sub(r'\\(.)', r'\1', match.group(1))
+	name = flip_constraint_name(name).replace('\\', '\\\\').replace('"', '\\"')
+	return f'["{name}"]'
+
+def flip_data_path(data_path):
+	""" Flip the names in the ["quoted"] parts of a data path, eg. bone, constraint and custom property names. """
+	return re.sub(r'\["((?:[^"\\]|\\.)*)"\]', _flip_quoted_name, data_path)
+
+def mirror_pairs(bones, sign, create_missing, sources=None):
+	""" Pair up bones with the bones of the same name on the opposite side.
+	bones: List of (name, x) tuples, where x tells which side of the X axis the bone is on.
+	sign: 1 to mirror the +X side onto the -X side, -1 for the other way around.
+	create_missing: Also pair up bones whose opposite bone doesn't exist.
+	sources: If given, only these bone names are mirrored.
+	Return the list of (source, target) name pairs, and the target names that don't exist yet.
+	"""
+	side_of = dict(bones)
+	pairs = []
+	missing = []
+	targets = set()
+	for name, x in bones:
+		if x * sign <= 0: continue
+		if sources is not None and name not in sources: continue
+		flipped = flip_name(name)
+		if flipped == name: continue
+		if flipped in targets:
+			print(f"WARNING: Several bones flip to {flipped}, skipping {name}.")
+			continue
+		if flipped in side_of:
+			if side_of[flipped] * sign > 0:
+				print(f"WARNING: Bones {name} and {flipped} are on the same side, mirroring would be ambiguous, skipping.")
+				continue
+		elif create_missing:
+			missing.append(flipped)
+		else:
+			continue
+		targets.add(flipped)
+		pairs.append((name, flipped))
+	return pairs, missing
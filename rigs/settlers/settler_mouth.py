@@ -14,6 +14,21 @@ class SettlerMouthRig(CloudCurveRig):
 	and also has a target for a mesh to Shrinkwrap to,
 	and adds some custom properties and drivers to control the shrinkwrap strength."""
 
+	@classmethod
+	def validate_metarig(cls, validator, pose_bone):
+		super().validate_metarig(validator, pose_bone)
+		params = pose_bone.rigify_parameters
+		second_curve = params.SETTLERS_target_curve
+		if not second_curve: return
+		if not validator.check(second_curve.type=='CURVE' and len(second_curve.data.splines) > 0, f"Curve 2 target {second_curve.name} is not a curve with a spline, for rig: {pose_bone.name}"): return
+
+		# Both curves get the same hooks, so they need the same number of points.
+		curve_ob = cls.datablock_from_str(bpy.data.objects, params.CR_target_curve_name)
+		if curve_ob and curve_ob.type=='CURVE' and len(curve_ob.data.splines) > 0:
+			num_points = len(second_curve.data.splines[0].bezier_points)
+			num_hooks = len(curve_ob.data.splines[0].bezier_points)
+			validator.check(num_points == num_hooks, f"Curve object {second_curve.name} has {num_points} points, but {curve_ob.name} has {num_hooks}, for rig: {pose_bone.name}")
+
 	def shrinkwrap_bones(self, bones, target_ob):
 		assert target_ob, f"Error: Could not find shrinkwrap target: {target_ob}"
 		
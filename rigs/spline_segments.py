@@ -0,0 +1,20 @@
+# This module doesn't depend on bpy, so it can be tested on its own.
+
+def split_segments(length, subdiv, max_bones):
+	""" Split a chain of ORG bones into ranges of ORG bone indices, each of which gets its own Spline IK constraint.
+	Each ORG bone is subdivided into subdiv deform bones, and a segment may have at most max_bones deform bones.
+	Return a list of (first, last) tuples, where last is exclusive.
+	"""
+	assert subdiv <= max_bones, f"Error: Each bone is subdivided {subdiv} times, which doesn't fit in segments of {max_bones} bones."
+	org_per_segment = max_bones // subdiv
+	return [(i, min(i+org_per_segment, length)) for i in range(0, length, org_per_segment)]
+
+def segment_bones(def_bones, segments, subdiv):
+	""" Split the deform chain into the bones of each segment, given the segments' ranges of ORG bone indices. """
+	return [def_bones[first*subdiv : last*subdiv] for first, last in segments]
+
+def segment_report(rig_name, bone_counts):
+	""" Return the message that reports the per-segment bone counts of a segmented Spline IK rig, or None if it has a single segment. """
+	if len(bone_counts) < 2:
+		return None
+	return f"Spline IK rig {rig_name}: {sum(bone_counts)} deform bones in {len(bone_counts)} segments: {bone_counts}"
@@ -0,0 +1,4 @@
+import os, sys
+
+# Only modules that don't depend on bpy can be tested outside of Blender. Make them importable as eg. rigs.naming.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
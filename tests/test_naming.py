@@ -0,0 +1,229 @@
+import pytest
+
+from rigs.naming import flip_name, flip_constraint_name, flip_data_path, mirror_pairs
+
+# These pin the output of flip_name() from before it was made table-driven, quirks included.
+# Eg. with only=True, a side prefix is moved to the end of the name, and with only=False, sides separated by - or _ are left alone.
+
+FLIP_ONLY_SUFFIXES = [
+	('Hand.L', 'Hand.R'),
+	('Hand.R', 'Hand.L'),
+	('hand.l', 'hand.r'),
+	('hand.r', 'hand.l'),
+	('Hand_L', 'Hand_R'),
+	('Hand_R', 'Hand_L'),
+	('hand_l', 'hand_r'),
+	('Hand-L', 'Hand-R'),
+	('hand-r', 'hand-l'),
+	('ORG-Thigh.L', 'ORG-Thigh.R'),
+	('DEF-Shin.R.002', 'DEF-Shin.L.002'),
+	('_leg.L', '_leg.R'),
+]
+
+FLIP_ONLY_PREFIXES = [
+	('L.Hand', 'HandR.'),
+	('r.hand', 'handl.'),
+	('L_Hand', 'HandR_'),
+	('l_hand', 'handr_'),
+	('R-Hand', 'HandL-'),
+	('r-hand', 'handl-'),
+]
+
+FLIP_ONLY_WORDS = [
+	('LeftArm', 'ArmRight'),
+	('RightArm', 'ArmLeft'),
+	('ARM_LEFT', 'ARM_RIGHT'),
+	('arm_right', 'arm_left'),
+	('Eye_Left', 'Eye_Right'),
+	('Eye_Right', 'Eye_Left'),
+	('left', 'right'),
+	('Right', 'Left'),
+	('Left_Eyelid.L', '_Eyelid.LRight'),
+	('LEFT.L', '.LRIGHT'),
+	('Eyelid_Left_Upper.L', 'Eyelid_Left_Upper.R'),
+	('Brow-Left.R', 'Brow-Left.L'),
+]
+
+FLIP_ONLY_NUMBERS = [
+	('Arm.L.001', 'Arm.R.001'),
+	('Arm.R.023', 'Arm.L.023'),
+	('Arm.L.001.002', 'Arm.L.001.002'),
+	('Arm.001', 'Arm.001'),
+	('Lip_Upper.L.001', 'Lip_Upper.R.001'),
+	('Foot.L.abc', 'Foot.L.abc'),
+	('Hand.l.', 'Hand.l.'),
+]
+
+FLIP_ONLY_UNFLIPPABLE = [
+	('Leg', 'Leg'),
+	('Middle', 'Middle'),
+	('L', 'L'),
+	('R', 'R'),
+	('.L', '.R'),
+	('Hand.L.L', 'Hand.L.R'),
+	('Arm.L.Twist', 'Arm.L.Twist'),
+	('Arm.L.Twist.R', 'Arm.L.Twist.L'),
+	('*rgt*Hand', 'Handright'),
+]
+
+FLIP_ALL_SUFFIXES = [
+	('Hand.L', 'Hand.R'),
+	('Hand.R', 'Hand.L'),
+	('hand.l', 'hand.r'),
+	('hand.r', 'hand.l'),
+	('Hand_L', 'Hand_L'),
+	('Hand_R', 'Hand_R'),
+	('hand_l', 'hand_l'),
+	('Hand-L', 'Hand-L'),
+	('hand-r', 'hand-r'),
+	('ORG-Thigh.L', 'ORG-Thigh.R'),
+	('DEF-Shin.R.002', 'DEF-Shin.L.002'),
+	('_leg.L', '_leg.R'),
+]
+
+FLIP_ALL_PREFIXES = [
+	('L.Hand', 'R.Hand'),
+	('r.hand', 'l.hand'),
+	('L_Hand', 'L_Hand'),
+	('l_hand', 'l_hand'),
+	('R-Hand', 'R-Hand'),
+	('r-hand', 'r-hand'),
+]
+
+FLIP_ALL_WORDS = [
+	('LeftArm', 'RightArm'),
+	('RightArm', 'LeftArm'),
+	('ARM_LEFT', 'ARM_RIGHT'),
+	('arm_right', 'arm_left'),
+	('Eye_Left', 'Eye_Right'),
+	('Eye_Right', 'Eye_Left'),
+	('left', 'right'),
+	('Right', 'Left'),
+	('Left_Eyelid.L', 'Right_Eyelid.R'),
+	('LEFT.L', 'RIGHT.R'),
+	('Eyelid_Left_Upper.L', 'Eyelid_Right_Upper.R'),
+	('Brow-Left.R', 'Brow-Right.L'),
+]
+
+FLIP_ALL_NUMBERS = [
+	('Arm.L.001', 'Arm.R.001'),
+	('Arm.R.023', 'Arm.L.023'),
+	('Arm.L.001.002', 'Arm.R.001.002'),
+	('Arm.001', 'Arm.001'),
+	('Lip_Upper.L.001', 'Lip_Upper.R.001'),
+	('Foot.L.abc', 'Foot.R.abc'),
+	('Hand.l.', 'Hand.l.'),
+]
+
+FLIP_ALL_UNFLIPPABLE = [
+	('Leg', 'Leg'),
+	('Middle', 'Middle'),
+	('L', 'L'),
+	('R', 'R'),
+	('.L', '.R'),
+	('Hand.L.L', 'Hand.R.R'),
+	('Arm.L.Twist', 'Arm.R.Twist'),
+	('Arm.L.Twist.R', 'Arm.R.Twist.L'),
+	('*rgt*Hand', 'rightHand'),
+]
+
+@pytest.mark.parametrize("name, flipped", FLIP_ONLY_SUFFIXES)
+def test_flip_only_suffixes(name, flipped):
+	assert flip_name(name, only=True) == flipped
+
+@pytest.mark.parametrize("name, flipped", FLIP_ONLY_PREFIXES)
+def test_flip_only_prefixes(name, flipped):
+	assert flip_name(name, only=True) == flipped
+
+@pytest.mark.parametrize("name, flipped", FLIP_ONLY_WORDS)
+def test_flip_only_words(name, flipped):
+	assert flip_name(name, only=True) == flipped
+
+@pytest.mark.parametrize("name, flipped", FLIP_ONLY_NUMBERS)
+def test_flip_only_numbers(name, flipped):
+	assert flip_name(name, only=True) == flipped
+
+@pytest.mark.parametrize("name, flipped", FLIP_ONLY_UNFLIPPABLE)
+def test_flip_only_unflippable(name, flipped):
+	assert flip_name(name, only=True) == flipped
+
+@pytest.mark.parametrize("name, flipped", FLIP_ALL_SUFFIXES)
+def test_flip_all_suffixes(name, flipped):
+	assert flip_name(name, only=False) == flipped
+
+@pytest.mark.parametrize("name, flipped", FLIP_ALL_PREFIXES)
+def test_flip_all_prefixes(name, flipped):
+	assert flip_name(name, only=False) == flipped
+
+@pytest.mark.parametrize("name, flipped", FLIP_ALL_WORDS)
+def test_flip_all_words(name, flipped):
+	assert flip_name(name, only=False) == flipped
+
+@pytest.mark.parametrize("name, flipped", FLIP_ALL_NUMBERS)
+def test_flip_all_numbers(name, flipped):
+	assert flip_name(name, only=False) == flipped
+
+@pytest.mark.parametrize("name, flipped", FLIP_ALL_UNFLIPPABLE)
+def test_flip_all_unflippable(name, flipped):
+	assert flip_name(name, only=False) == flipped
+
+def test_flip_is_symmetric():
+	for name in ["Hand.L", "DEF-Shin.R.002", "Eye_Left", "Lip_Upper.L.001"]:
+		assert flip_name(flip_name(name)) == name
+
+def test_must_change():
+	assert flip_name("Hand.L", must_change=True) == "Hand.R"
+	with pytest.raises(AssertionError):
+		flip_name("Middle", must_change=True)
+
+@pytest.mark.parametrize("name, flipped", [
+	("Copy Rotation", "Copy Rotation"),
+	("Copy Rotation@FK-Arm.L", "Copy Rotation@FK-Arm.R"),
+	("Armature@DEF-Hand.R@DEF-Finger.R", "Armature@DEF-Hand.L@DEF-Finger.L"),
+	("Transform.L@MCH-Eye.L", "Transform.R@MCH-Eye.R"),
+])
+def test_flip_constraint_name(name, flipped):
+	assert flip_constraint_name(name) == flipped
+
+@pytest.mark.parametrize("data_path, flipped", [
+	('location', 'location'),
+	('pose.bones["Hand.L"].location', 'pose.bones["Hand.R"].location'),
+	('pose.bones["Hand.L"].constraints["Copy@Arm.L"].influence', 'pose.bones["Hand.R"].constraints["Copy@Arm.R"].influence'),
+	('pose.bones["Properties"]["ik_arm.L"]', 'pose.bones["Properties"]["ik_arm.R"]'),
+	('bones["Eyelid.R.001"].bbone_easein', 'bones["Eyelid.L.001"].bbone_easein'),
+	# Quotes and backslashes in names are escaped.
+	('pose.bones["Say \\"hi\\".L"]["prop.L"]', 'pose.bones["Say \\"hi\\".R"]["prop.R"]'),
+	('bones["a\\\\.L"].head', 'bones["a\\\\.R"].head'),
+	('pose.bones["\\"Quoted\\""].location', 'pose.bones["\\"Quoted\\""].location'),
+])
+def test_flip_data_path(data_path, flipped):
+	assert flip_data_path(data_path) == flipped
+	assert flip_data_path(flipped) == data_path
+
+def test_mirror_pairs():
+	bones = [("Spine", 0), ("Arm.L", 1), ("Arm.R", -1), ("Hand.L", 1), ("Eye.R", -1)]
+	pairs, missing = mirror_pairs(bones, 1, create_missing=True)
+	assert pairs == [("Arm.L", "Arm.R"), ("Hand.L", "Hand.R")]
+	assert missing == ["Hand.R"]
+
+	pairs, missing = mirror_pairs(bones, -1, create_missing=True)
+	assert pairs == [("Arm.R", "Arm.L"), ("Eye.R", "Eye.L")]
+	assert missing == ["Eye.L"]
+
+def test_mirror_pairs_without_creating():
+	bones = [("Arm.L", 1), ("Arm.R", -1), ("Hand.L", 1)]
+	assert mirror_pairs(bones, 1, create_missing=False) == ([("Arm.L", "Arm.R")], [])
+
+def test_mirror_pairs_only_sources():
+	bones = [("Arm.L", 1), ("Hand.L", 1)]
+	assert mirror_pairs(bones, 1, create_missing=True, sources={"Hand.L"}) == ([("Hand.L", "Hand.R")], ["Hand.R"])
+
+def test_mirror_pairs_skips_ambiguous():
+	# Both bones are on the left side, so neither can be mirrored onto the other, and no bone is created for the skipped pair.
+	bones = [("Arm.L", 1), ("Arm.R", 0.5), ("Hand.L", 1)]
+	assert mirror_pairs(bones, 1, create_missing=True) == ([("Hand.L", "Hand.R")], ["Hand.R"])
+
+def test_mirror_pairs_skips_duplicate_targets():
+	# "LeftArm" is flipped by moving the side to the end, so it flips to the same name as "ArmLeft".
+	bones = [("ArmLeft", 1), ("LeftArm", 1)]
+	assert mirror_pairs(bones, 1, create_missing=True) == ([("ArmLeft", "ArmRight")], ["ArmRight"])
@@ -0,0 +1,45 @@
+from cloud_refit import planned_bones, write_edit_bones
+
+class FakeBoneInfo:
+	def __init__(self, name):
+		self.name = name
+		self.written_to = None
+
+	def write_edit_geometry(self, edit_bone):
+		self.written_to = edit_bone
+
+class FakeBoneInfoContainer:
+	def __init__(self, names):
+		self.bones = [FakeBoneInfo(name) for name in names]
+
+class FakeCloudRig:
+	""" A rig that plans its bones with BoneInfos, like every CloudBaseRig. """
+	def __init__(self, *names):
+		self.bone_infos = FakeBoneInfoContainer(names)
+
+class FakeBoneRig:
+	""" A rig without BoneInfos, like cloud_bone. """
+
+def test_rigs_without_bone_infos_are_skipped():
+	chain = FakeCloudRig("FK-A", "FK-B")
+	rig_list = [FakeBoneRig(), chain, FakeBoneRig()]
+	assert [bi.name for rig, bi in planned_bones(rig_list)] == ["FK-A", "FK-B"]
+	assert all(rig is chain for rig, bi in planned_bones(rig_list))
+
+def test_write_edit_bones_with_cloud_bone_rig():
+	chain = FakeCloudRig("FK-A", "FK-B")
+	spine = FakeCloudRig("FK-Hips")
+	edit_bones = {"FK-A" : "edit FK-A", "FK-B" : "edit FK-B", "FK-Hips" : "edit FK-Hips"}
+
+	missing = write_edit_bones([chain, FakeBoneRig(), spine], edit_bones)
+
+	assert missing == set()
+	for rig in (chain, spine):
+		for bi in rig.bone_infos.bones:
+			assert bi.written_to == edit_bones[bi.name]
+
+def test_write_edit_bones_reports_missing():
+	chain = FakeCloudRig("FK-A", "FK-New")
+	missing = write_edit_bones([FakeBoneRig(), chain], {"FK-A" : "edit FK-A"})
+	assert missing == {"FK-New"}
+	assert chain.bone_infos.bones[1].written_to is None
@@ -0,0 +1,60 @@
+import pytest
+
+from rigs.spline_segments import split_segments, segment_bones, segment_report
+
+def test_single_segment_when_chain_fits():
+	assert split_segments(10, 4, 255) == [(0, 10)]
+
+def test_segments_cover_chain_without_gaps():
+	segments = split_segments(300, 4, 255)
+	assert segments[0][0] == 0
+	assert segments[-1][1] == 300
+	for (first, last), (next_first, next_last) in zip(segments, segments[1:]):
+		assert last == next_first
+
+@pytest.mark.parametrize("length, subdiv, max_bones", [
+	(1000, 1, 255),
+	(1000, 3, 255),
+	(1200, 2, 100),
+	(257, 1, 255),
+])
+def test_over_thousand_deform_bones(length, subdiv, max_bones):
+	segments = split_segments(length, subdiv, max_bones)
+	deform_counts = [(last - first) * subdiv for first, last in segments]
+	assert sum(deform_counts) == length * subdiv
+	assert max(deform_counts) <= max_bones
+	assert all(count > 0 for count in deform_counts)
+
+def test_last_segment_takes_the_remainder():
+	assert split_segments(600, 1, 255) == [(0, 255), (255, 510), (510, 600)]
+
+def test_subdivision_larger_than_segment():
+	with pytest.raises(AssertionError):
+		split_segments(10, 300, 255)
+
+@pytest.mark.parametrize("length, subdiv, max_bones", [
+	(1000, 1, 255),
+	(400, 3, 255),
+	(1100, 2, 100),
+])
+def test_segment_bones_of_long_chain(length, subdiv, max_bones):
+	# The same split as CloudSplineIKRig.configure_bones() does for its constraints.
+	def_bones = [f"DEF-Tail.{i:04}" for i in range(length*subdiv)]
+	segments = split_segments(length, subdiv, max_bones)
+	bone_sets = segment_bones(def_bones, segments, subdiv)
+
+	assert len(bone_sets) == len(segments) > 1
+	assert [name for bones in bone_sets for name in bones] == def_bones
+	assert all(0 < len(bones) <= max_bones for bones in bone_sets)
+	# Each constraint goes on the last bone of its segment, which is the last deform bone of an ORG bone.
+	for (first, last), bones in zip(segments, bone_sets):
+		assert bones[-1] == def_bones[last*subdiv - 1]
+
+def test_segment_report():
+	bone_sets = segment_bones(list(range(1000)), split_segments(1000, 1, 255), 1)
+	report = segment_report("Tail", [len(bones) for bones in bone_sets])
+	assert report == "Spline IK rig Tail: 1000 deform bones in 4 segments: [255, 255, 255, 235]"
+
+def test_no_report_for_single_segment():
+	bone_sets = segment_bones(list(range(20)), split_segments(10, 2, 255), 2)
+	assert segment_report("Tail", [len(bones) for bones in bone_sets]) is None
@@ -22,7 +22,10 @@ def draw_cloud_generator_options(self, context):
 	if obj.mode not in {'POSE', 'OBJECT'}:
 		return
 
-	layout.operator("pose.cloudrig_generate", text="Generate CloudRig")
+	row = layout.row(align=True)
+	row.operator("pose.cloudrig_generate", text="Generate CloudRig")
+	if obj.data.rigify_target_rig:
+		row.operator("pose.cloudrig_refit", text="", icon='MOD_ARMATURE')
 
 	cloudrig = obj.data.cloudrig_parameters
 
@@ -43,6 +46,8 @@ def draw_cloud_generator_options(self, context):
 	if cloudrig.mechanism_selectable:
 		mech_row.prop(cloudrig, "mechanism_movable")
 
+	layout.prop(cloudrig, "symmetric_generation")
+
 	layout.prop(obj.data, "rigify_force_widget_update")
 
 	naming_row = layout.row()
@@ -211,6 +216,29 @@ class CloudGenerate(bpy.types.Operator):
 
 		return {'FINISHED'}
 
+class CloudRefit(bpy.types.Operator):
+	"""Move the bones of the generated rig to match the metarig, without regenerating it. Only works when bones were moved, not added, removed or re-parameterized"""
+
+	bl_idname = "pose.cloudrig_refit"
+	bl_label = "CloudRig Re-fit Rig"
+	bl_options = {'UNDO'}
+
+	def execute(self, context):
+		try:
+			missing = cloud_generator.refit_rig(context, context.object)
+			if missing:
+				self.report({'WARNING'}, f"{len(missing)} bones are missing from the rig, it should be regenerated. See the console for details.")
+		except MetarigError as rig_exception:
+			traceback.print_exc()
+
+			rigify_report_exception(self, rig_exception)
+		except Exception as rig_exception:
+			traceback.print_exc()
+
+			self.report({'ERROR'}, 'Re-fitting has thrown an exception: ' + str(rig_exception))
+
+		return {'FINISHED'}
+
 def ui_label_with_linebreak(layout, text):
 	words = text.split(" ")
 	word_index = 0
@@ -238,9 +266,19 @@ def ui_label_with_linebreak(layout, text):
 	for line in lines:
 		layout.label(text=line)
 
+def draw_cloudrig_rescale(self, context):
+	""" Add the Rescale operator to the Object->Apply menu of generated CloudRigs. """
+	obj = context.object
+	if not (obj and obj.type=='ARMATURE' and 'cloudrig' in obj.data):
+		return
+	layout = self.layout
+	layout.separator()
+	layout.operator("object.cloudrig_rescale", icon='FULLSCREEN_ENTER')
+
 def register():
 	from bpy.utils import register_class
 	register_class(CloudGenerate)
+	register_class(CloudRefit)
 	register_class(CloudRigLayerInit)
 	
 	
@@ -254,12 +292,17 @@ def register():
 	bpy.types.DATA_PT_rigify_layer_names.draw_old = bpy.types.DATA_PT_rigify_layer_names.draw
 	bpy.types.DATA_PT_rigify_layer_names.draw = draw_cloud_layer_names
 
+	bpy.types.VIEW3D_MT_object_apply.append(draw_cloudrig_rescale)
+
 def unregister():
 	from bpy.utils import unregister_class
 	unregister_class(CloudGenerate)
+	unregister_class(CloudRefit)
 	unregister_class(CloudRigLayerInit)
 	
 	# Restore Rigify panels' draw functions.
 	bpy.types.DATA_PT_rigify_buttons.draw = bpy.types.DATA_PT_rigify_buttons.draw_old
 	bpy.types.DATA_PT_rigify_bone_groups.draw = bpy.types.DATA_PT_rigify_bone_groups.draw_old
-	bpy.types.DATA_PT_rigify_layer_names.draw = bpy.types.DATA_PT_rigify_layer_names.draw_old
\ No newline at end of file
+	bpy.types.DATA_PT_rigify_layer_names.draw = bpy.types.DATA_PT_rigify_layer_names.draw_old
+
+	bpy.types.VIEW3D_MT_object_apply.remove(draw_cloudrig_rescale)
\ No newline at end of file